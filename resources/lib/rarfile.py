@@ -73,10 +73,10 @@ import errno
 import struct
 
 from struct import pack, unpack, Struct
-from binascii import crc32, hexlify
-from tempfile import mkstemp
+from binascii import crc32, hexlify, unhexlify
+from tempfile import mkstemp, TemporaryFile
 from subprocess import Popen, PIPE, STDOUT
-from io import RawIOBase
+from io import RawIOBase, BytesIO
 from hashlib import sha1, sha256
 from hmac import HMAC
 from datetime import datetime, timedelta, tzinfo
@@ -131,9 +131,16 @@ try:
             def __init__(self, key, iv):
                 self.decrypt = AES.new(key, AES.MODE_CBC, iv).decrypt
 
-        def pbkdf2_sha256(password, salt, iters):
-            """PBKDF2 with HMAC-SHA256"""
-            return KDF.PBKDF2(password, salt, 32, iters, hmac_sha256)
+        try:
+            from hashlib import pbkdf2_hmac
+
+            def pbkdf2_sha256(password, salt, iters):
+                """PBKDF2 with HMAC-SHA256"""
+                return pbkdf2_hmac('sha256', password, salt, iters, 32)
+        except ImportError:
+            def pbkdf2_sha256(password, salt, iters):
+                """PBKDF2 with HMAC-SHA256"""
+                return KDF.PBKDF2(password, salt, 32, iters, hmac_sha256)
 
     _have_crypto = 1
 except ImportError:
@@ -149,6 +156,9 @@ try:
 except ImportError:
     _have_blake2 = False
 
+# in-process decompression, imported on first use, see _load_unpack()
+rarunpack = None
+
 # compat with 2.x
 if sys.hexversion < 0x3000000:
     def rar_crc32(data, prev=0):
@@ -174,7 +184,7 @@ else:  # pragma: no cover
 __version__ = '3.0'
 
 # export only interesting items
-__all__ = ['is_rarfile', 'RarInfo', 'RarFile', 'RarExtFile']
+__all__ = ['is_rarfile', 'RarInfo', 'RarFile', 'RarExtFile', 'SpoolFile']
 
 ##
 ## Module configuration.  Can be tuned after importing.
@@ -221,6 +231,42 @@ USE_EXTRACT_HACK = 1
 #: limit the filesize for tmp archive usage
 HACK_SIZE_LIMIT = 20 * 1024 * 1024
 
+#: whether to decompress RAR3 and RAR5 data in-process instead of running unrar,
+#: see rarunpack for its license and speed
+USE_PYTHON_UNPACK = 0
+
+#: file to remember which tool works between runs, None to probe on every run
+TOOL_CACHE_FILE = None
+
+#: max bytes of solid archive entries to keep when decompressing past them
+SOLID_CACHE_SIZE = 16 * 1024 * 1024
+
+#: whether to give temporary archives to unrar as in-memory files (Linux memfd)
+USE_MEMFD = 1
+
+#: directory for temporary archives when memfd is not usable, None for system default
+TMPFS_DIR = '/dev/shm'
+
+#: max number of keys derived from passwords to keep
+KEY_CACHE_SIZE = 64
+
+#: file to remember derived keys between runs, None to keep them in memory only.
+#: The keys decrypt the archives, so the file must not be readable by others.
+KEY_CACHE_FILE = None
+
+#: whether to read RAR5 headers from the copies in the quick open record
+#: at the end of the archive, when the archive has one
+USE_QUICK_OPEN = 1
+
+#: Blake2SP updates at least this large gather each lane's blocks in bulk
+BLAKE2SP_BULK_SIZE = 16 * 1024
+
+#: Blake2SP updates at least this large hash their lanes in worker threads
+BLAKE2SP_THREAD_SIZE = 256 * 1024
+
+#: number of threads hashing Blake2SP lanes, None for one per CPU, 0 to hash on the reading thread
+BLAKE2SP_THREADS = None
+
 #: Separator for path name components.  RAR internally uses '\\'.
 #: Use '/' to be similar with zipfile.
 PATH_SEP = '/'
@@ -325,6 +371,11 @@ RAR5_MAIN_FLAG_SOLID = 0x04
 RAR5_MAIN_FLAG_RECOVERY = 0x08
 RAR5_MAIN_FLAG_LOCKED = 0x10
 
+RAR5_XMAIN_LOCATOR = 1
+
+RAR5_XLOCATOR_QOPEN = 0x01
+RAR5_XLOCATOR_RECOVERY = 0x02
+
 RAR5_FILE_FLAG_ISDIR = 0x01
 RAR5_FILE_FLAG_HAS_MTIME = 0x02
 RAR5_FILE_FLAG_HAS_CRC32 = 0x04
@@ -476,6 +527,20 @@ class RarCannotExec(RarExecError):
     """Executable not found."""
 
 
+def _time_property(slot):
+    """Time field that is decoded when first used."""
+    def fget(self):
+        if self._times is not None:
+            self._load_times()
+        return getattr(self, slot)
+
+    def fset(self, value):
+        if self._times is not None:
+            self._load_times()
+        setattr(self, slot, value)
+    return property(fget, fset)
+
+
 class RarInfo(object):
     r"""An entry in rar archive.
 
@@ -572,25 +637,22 @@ class RarInfo(object):
 
     """
 
-    # zipfile-compatible fields
-    filename = None
-    file_size = None
-    compress_size = None
-    date_time = None
-    comment = None
-    CRC = None
-    volume = None
-    orig_filename = None
-
-    # optional extended time fields, datetime() objects.
-    mtime = None
-    ctime = None
-    atime = None
-
+    # archives can hold thousands of entries, keep them without __dict__
+    __slots__ = (
+        # zipfile-compatible fields
+        'filename', 'file_size', 'compress_size', 'CRC',
+        'volume', 'volume_file', 'orig_filename',
+        'mode', 'host_os', 'compress_type',
+        # time fields, decoded from _times on first access
+        '_date_time', '_mtime', '_ctime', '_atime', '_times',
+        # internal fields
+        'flags', 'header_crc', 'header_size', 'header_offset', 'data_offset',
+        'add_size', '_md_class', '_md_expect',
+    )
+
+    # format-specific fields, slots in the subclasses that set them
     extract_version = None
-    mode = None
-    host_os = None
-    compress_type = None
+    type = None
 
     # rar3-only fields
     comment = None
@@ -600,9 +662,28 @@ class RarInfo(object):
     blake2sp_hash = None
     file_redir = None
 
-    # internal fields
-    flags = 0
-    type = None
+    def __init__(self):
+        self.filename = self.orig_filename = None
+        self.file_size = self.compress_size = None
+        self.CRC = None
+        self.volume = self.volume_file = None
+        self._date_time = self._mtime = self._ctime = self._atime = None
+        self._times = None
+        self.mode = self.host_os = self.compress_type = None
+        self.flags = 0
+        self.header_crc = self.header_size = None
+        self.header_offset = self.data_offset = None
+        self.add_size = 0
+        self._md_class = self._md_expect = None
+
+    def _load_times(self):
+        """Decode raw time fields kept in _times."""
+        self._times = None
+
+    date_time = _time_property('_date_time')
+    mtime = _time_property('_mtime')
+    ctime = _time_property('_ctime')
+    atime = _time_property('_atime')
 
     def isdir(self):
         """Returns True if entry is a directory.
@@ -623,11 +704,8 @@ class RarFile(object):
     """Parse RAR structure, provide access to files in archive.
     """
 
-    #: Archive comment.  Unicode string or None.
-    comment = None
-
     def __init__(self, rarfile, mode="r", charset=None, info_callback=None,
-                 crc_check=True, errors="stop"):
+                 crc_check=True, errors="stop", stream=False, member_filter=None):
         """Open and parse a RAR archive.
 
         Parameters:
@@ -645,13 +723,28 @@ class RarFile(object):
             errors
                 Either "stop" to quietly stop parsing on errors,
                 or "strict" to raise errors.  Default is "stop".
+            stream
+                Parse headers only as they are needed.  A non-seekable
+                file object is wrapped in :class:`SpoolFile`, so the archive
+                can be listed with :meth:`iterinfo` while it is still arriving.
+                :meth:`close` then closes the spool and the file object.
+            member_filter
+                Function that gets the filename of each file entry, or
+                filename suffix or tuple of them.  Entries it rejects are
+                skipped while parsing and are not listed or readable.
         """
+        self._spool = None
+        if stream and is_filelike(rarfile) and not is_seekable(rarfile):
+            rarfile = self._spool = SpoolFile(rarfile)
         self._rarfile = rarfile
+        self._stream = stream
+        self._parse_iter = None
         self._charset = charset or DEFAULT_CHARSET
         self._info_callback = info_callback
         self._crc_check = crc_check
         self._password = None
         self._file_parser = None
+        self._member_filter = _member_predicate(member_filter)
 
         if errors == "stop":
             self._strict = False
@@ -673,6 +766,16 @@ class RarFile(object):
         """Exit context"""
         self.close()
 
+    @property
+    def comment(self):
+        """Archive comment.  Unicode string or None.
+
+        In stream mode the rest of the headers are parsed first,
+        as the comment may come after the file entries.
+        """
+        self._finish_parse()
+        return self._file_parser.comment
+
     def setpassword(self, password):
         """Sets the password to use when extracting.
         """
@@ -688,6 +791,7 @@ class RarFile(object):
     def needs_password(self):
         """Returns True if any archive entries require password for extraction.
         """
+        self._finish_parse()
         return self._file_parser.needs_password()
 
     def namelist(self):
@@ -698,20 +802,46 @@ class RarFile(object):
     def infolist(self):
         """Return RarInfo objects for all files/directories in archive.
         """
+        self._finish_parse()
         return self._file_parser.infolist()
 
+    def iterinfo(self):
+        """Iterate over RarInfo objects for all files/directories in archive.
+
+        In stream mode each entry is returned as soon as its header
+        has been parsed, a file split over volumes once its last part has.
+        """
+        pos = 0
+        while 1:
+            infos = self._file_parser.infolist()
+            if pos < len(infos) and not self._file_parser.is_pending(infos[pos]):
+                yield infos[pos]
+                pos += 1
+            elif not self._parse_more():
+                break
+
     def volumelist(self):
         """Returns filenames of archive volumes.
 
         In case of single-volume archive, the list contains
         just the name of main archive file.
         """
+        self._finish_parse()
         return self._file_parser.volumelist()
 
     def getinfo(self, fname):
         """Return RarInfo for file.
         """
-        return self._file_parser.getinfo(fname)
+        while 1:
+            try:
+                inf = self._file_parser.getinfo(fname)
+            except NoRarEntry:
+                if not self._parse_more():
+                    raise
+                continue
+            # size and CRC of split file come with its last part
+            if not self._file_parser.is_pending(inf) or not self._parse_more():
+                return inf
 
     def open(self, fname, mode='r', psw=None):
         """Returns file-like object (:class:`RarExtFile`) from where the data can be read.
@@ -771,9 +901,61 @@ class RarFile(object):
         with self.open(fname, 'r', psw) as f:
             return f.read()
 
+    def read_many(self, fnames, psw=None):
+        """Return uncompressed data for several archive entries.
+
+        Entries that need unrar are decompressed by single unrar run,
+        its output is split by entry sizes and each part is checked
+        against its own CRC.
+
+        Parameters:
+
+            fnames
+                list of filenames or RarInfo instances
+            psw
+                password to use for extracting.
+
+        Returns list of data in the order of fnames.
+        """
+
+        infs = [self.getinfo(fn) for fn in fnames]
+        for inf in infs:
+            if inf.isdir():
+                raise TypeError("Directory does not have any data: " + inf.filename)
+
+        # check password
+        locked = [inf for inf in infs if inf.needs_password()]
+        if locked:
+            psw = psw or self._password
+            if psw is None:
+                raise PasswordRequired("File %s requires password" % locked[0].filename)
+        else:
+            psw = None
+
+        return self._file_parser.read_many(infs, psw)
+
+    def iterread(self, psw=None):
+        """Iterate over (RarInfo, data) of all file entries in archive order.
+
+        Solid runs decompressed in-process are passed only once.
+        In stream mode each entry is returned as soon as its data
+        has arrived.
+
+        Parameters:
+
+            psw
+                password to use for extracting.
+        """
+        for inf in self.iterinfo():
+            if not inf.isdir():
+                yield inf, self.read(inf, psw)
+
     def close(self):
         """Release open resources."""
-        pass
+        self._parse_iter = None
+        if self._spool:
+            self._spool.close()
+            self._spool = None
 
     def printdir(self):
         """Print archive file list to stdout."""
@@ -822,10 +1004,11 @@ class RarFile(object):
     def testrar(self):
         """Let 'unrar' test the archive.
         """
+        _ensure_unrar_tool()
         cmd = [UNRAR_TOOL] + list(TEST_ARGS)
         add_password_arg(cmd, self._password)
         cmd.append('--')
-        with XTempFile(self._rarfile) as rarfile:
+        with XTempFile(self._rarfile, self._file_parser._single_volume()) as rarfile:
             cmd.append(rarfile)
             p = custom_popen(cmd)
             output = p.communicate()[0]
@@ -836,6 +1019,7 @@ class RarFile(object):
         """
         if not self._file_parser:
             return "Not a RAR file"
+        self._finish_parse()
         return self._file_parser.strerror()
 
     ##
@@ -846,20 +1030,40 @@ class RarFile(object):
         ver = _get_rar_version(self._rarfile)
         if ver == 3:
             p3 = RAR3Parser(self._rarfile, self._password, self._crc_check,
-                            self._charset, self._strict, self._info_callback)
+                            self._charset, self._strict, self._info_callback,
+                            self._member_filter)
             self._file_parser = p3  # noqa
         elif ver == 5:
             p5 = RAR5Parser(self._rarfile, self._password, self._crc_check,
-                            self._charset, self._strict, self._info_callback)
+                            self._charset, self._strict, self._info_callback,
+                            self._member_filter)
             self._file_parser = p5  # noqa
         else:
             raise BadRarFile("Not a RAR file")
 
-        self._file_parser.parse()
-        self.comment = self._file_parser.comment
+        if self._stream:
+            self._parse_iter = self._file_parser.iterparse()
+        else:
+            self._file_parser.parse()
+
+    # stream mode: parse next entry, returns False when archive is done
+    def _parse_more(self):
+        if self._parse_iter is None:
+            return False
+        try:
+            next(self._parse_iter)
+            return True
+        except StopIteration:
+            self._parse_iter = None
+            return False
+
+    def _finish_parse(self):
+        while self._parse_more():
+            pass
 
     # call unrar to extract a file
     def _extract(self, fnlist, path=None, psw=None):
+        _ensure_unrar_tool()
         cmd = [UNRAR_TOOL] + list(EXTRACT_ARGS)
 
         # pasoword
@@ -868,7 +1072,7 @@ class RarFile(object):
         cmd.append('--')
 
         # rar file
-        with XTempFile(self._rarfile) as rarfn:
+        with XTempFile(self._rarfile, self._file_parser._single_volume()) as rarfn:
             cmd.append(rarfn)
 
             # file list
@@ -892,6 +1096,7 @@ class RarFile(object):
 
 class CommonParser(object):
     """Shared parser parts."""
+    _parsed = False
     _main = None
     _hdrenc_main = None
     _needs_password = False
@@ -899,18 +1104,28 @@ class CommonParser(object):
     _expect_sig = None
     _parse_error = None
     _password = None
+    _skip_last = False
+    _pending = None
     comment = None
 
-    def __init__(self, rarfile, password, crc_check, charset, strict, info_cb):
+    def __init__(self, rarfile, password, crc_check, charset, strict, info_cb,
+                 member_filter=None):
         self._rarfile = rarfile
         self._password = password
         self._crc_check = crc_check
         self._charset = charset
         self._strict = strict
         self._info_callback = info_cb
+        self._member_filter = member_filter
         self._info_list = []
         self._info_map = {}
         self._vol_list = []
+        # all file entries of a solid archive, when filtered ones are left out of _info_list
+        self._solid_list = None
+        # solid run state: entries decompressed on the way, unpacker left after last entry
+        self._solid_cache = {}
+        self._solid_cache_size = 0
+        self._solid_resume = None
 
     def has_header_encryption(self):
         """Returns True if headers are encrypted
@@ -943,6 +1158,10 @@ class CommonParser(object):
         """
         return self._info_list
 
+    def is_pending(self, inf):
+        """Whether later parts of split file are not parsed yet."""
+        return inf is self._pending
+
     def getinfo(self, member):
         """Return RarInfo for filename
         """
@@ -968,9 +1187,16 @@ class CommonParser(object):
     # read rar
     def parse(self):
         """Process file."""
+        for _ in self.iterparse():
+            pass
+
+    def iterparse(self):
+        """Process file, yield file entries as their headers are parsed."""
         self._fd = None
         try:
-            self._parse_real()
+            for h in self._parse_real():
+                yield h
+            self._parsed = True
         finally:
             if self._fd:
                 self._fd.close()
@@ -1018,6 +1244,9 @@ class CommonParser(object):
             h.volume = volume
             h.volume_file = volfile
 
+            if h.type == RAR_BLOCK_MAIN:
+                fd = self._fd = self._quick_open(fd, h)
+
             if h.type == RAR_BLOCK_MAIN and not self._main:
                 self._main = h
                 if h.flags & RAR_MAIN_NEWNUMBERING:
@@ -1053,10 +1282,81 @@ class CommonParser(object):
             if h.add_size > 0:
                 fd.seek(h.data_offset + h.add_size, 0)
 
+            if h.type != RAR_BLOCK_FILE:
+                continue
+
+            # split file is complete when its last part is merged
+            done = []
+            if self._pending and not (h.flags & RAR_FILE_SPLIT_BEFORE and h.flags & RAR_FILE_SPLIT_AFTER):
+                done.append(self._pending)
+                self._pending = None
+            if self._info_list and self._info_list[-1] is h:
+                if h.flags & RAR_FILE_SPLIT_AFTER:
+                    self._pending = h
+                else:
+                    done.append(h)
+            for inf in done:
+                # the file may be read by others meanwhile
+                pos = fd.tell()
+                yield inf
+                fd.seek(pos, 0)
+
+        # last part missing
+        if self._pending:
+            inf, self._pending = self._pending, None
+            yield inf
+
     def process_entry(self, fd, item):
         """Examine item, add into lookup cache."""
         raise NotImplementedError()
 
+    def _wanted(self, item):
+        """Whether file entry passes the member filter."""
+        return self._member_filter is None or self._member_filter(item.filename)
+
+    def _add_entry(self, item):
+        """Add first part of file entry into lookup cache, False if filtered out."""
+        wanted = self._wanted(item)
+        if wanted:
+            self._info_map[item.filename] = item
+            self._info_list.append(item)
+        if self._member_filter is not None and self._is_solid():
+            # solid runs are decompressed through filtered entries too
+            if self._solid_list is None:
+                self._solid_list = []
+            self._solid_list.append(item)
+        self._skip_last = not wanted
+        return wanted
+
+    def _quick_open(self, fd, main):
+        """File to read rest of volume from, after its main header."""
+        return fd
+
+    def _redir_target(self, fname):
+        """Entry copied or hard linked, also if member filter left it out."""
+        try:
+            return self.getinfo(fname)
+        except NoRarEntry:
+            if self._member_filter is None:
+                raise
+        if self._solid_list is not None:
+            for inf in self._solid_list:
+                if inf.filename == fname:
+                    return inf
+        # skipped unparsed, look again without filter up to the target
+        parser = self.__class__(self._rarfile, self._password, self._crc_check,
+                                self._charset, self._strict, None)
+        entries = parser.iterparse()
+        try:
+            for ___ in entries:
+                try:
+                    return parser.getinfo(fname)
+                except NoRarEntry:
+                    pass
+        finally:
+            entries.close()
+        return parser.getinfo(fname)
+
     def _decrypt_header(self, fd):
         raise NotImplementedError('_decrypt_header')
 
@@ -1102,7 +1402,7 @@ class CommonParser(object):
         if inf.file_redir:
             # cannot leave to unrar as it expects copied file to exist
             if inf.file_redir[0] in (RAR5_XREDIR_FILE_COPY, RAR5_XREDIR_HARD_LINK):
-                inf = self.getinfo(inf.file_redir[2])
+                inf = self._redir_target(inf.file_redir[2])
                 if not inf:
                     raise BadRarFile('cannot find copied file')
 
@@ -1127,6 +1427,13 @@ class CommonParser(object):
         # now extract
         if inf.compress_type == RAR_M0 and (inf.flags & RAR_FILE_PASSWORD) == 0 and inf.file_redir is None:
             return self._open_clear(inf)
+
+        if id(inf) in self._solid_cache:
+            return MemoryReader(self, inf, self._solid_cache[id(inf)][1])
+
+        chain = self._unpack_chain(inf)
+        if chain:
+            return UnpackReader(self, inf, chain)
         elif use_hack:
             return self._open_hack(inf, psw)
         elif is_filelike(self._rarfile):
@@ -1134,17 +1441,157 @@ class CommonParser(object):
         else:
             return self._open_unrar(self._rarfile, inf, psw)
 
+    def read_many(self, infs, psw):
+        """Return data for several entries, one unrar run for all that need it."""
+
+        # entries unrar can be given by name and that it prints only once
+        counts = {}
+        for inf in self._info_list:
+            counts[inf.filename] = counts.get(inf.filename, 0) + 1
+        bulk = {}
+        for inf in infs:
+            if inf.file_redir or inf.flags & RAR_FILE_SPLIT_BEFORE:
+                continue
+            if inf.compress_type == RAR_M0 and (inf.flags & RAR_FILE_PASSWORD) == 0:
+                continue
+            if counts.get(inf.filename) != 1 or self._unpack_chain(inf):
+                continue
+            if '*' in inf.filename or '?' in inf.filename or inf.filename[:1] == '@':
+                continue
+            if _tool_filename(inf.filename) is None:
+                continue
+            bulk[id(inf)] = inf
+
+        data = {}
+        if len(bulk) > 1:
+            order = [inf for inf in self._info_list if id(inf) in bulk]
+            try:
+                for inf, buf in zip(order, self._read_unrar_many(order, psw)):
+                    data[id(inf)] = buf
+            except BadRarFile:
+                # unrar may fail to match names outside its locale,
+                # entries are read one by one to get the real error if any
+                data = {}
+
+        # archive order lets solid runs continue where the previous entry ended
+        wanted = set(id(inf) for inf in infs)
+        for inf in [inf for inf in self._info_list if id(inf) in wanted] + list(infs):
+            if id(inf) not in data:
+                with self.open(inf, psw if inf.needs_password() else None) as f:
+                    data[id(inf)] = f.read()
+        return [data[id(inf)] for inf in infs]
+
+    def _read_unrar_many(self, infs, psw):
+        # unrar prints entries in archive order, infs must follow it
+        _ensure_unrar_tool()
+        if is_filelike(self._rarfile):
+            tmpfile = rarfile = membuf_tempfile(self._rarfile, self._single_volume())
+        else:
+            tmpfile, rarfile = None, self._rarfile
+        cmd = [UNRAR_TOOL] + list(OPEN_ARGS)
+        add_password_arg(cmd, psw)
+        cmd.append("--")
+        cmd.append(rarfile)
+        for inf in infs:
+            cmd.append(_tool_filename(inf.filename))
+
+        try:
+            p = custom_popen(cmd)
+            try:
+                if p.stdin:
+                    p.stdin.close()
+                # entry sizes split the output, each part is checked against its own hash
+                res = []
+                for inf in infs:
+                    with PipePartReader(self, inf, p.stdout) as f:
+                        res.append(f.read())
+            finally:
+                p.stdout.close()
+                p.wait()
+            return res
+        finally:
+            if tmpfile:
+                remove_tempfile(tmpfile)
+
     def _open_clear(self, inf):
         return DirectReader(self, inf)
 
+    def _unpack_chain(self, inf):
+        """Members to decompress in-process to get to inf, None if unrar is needed.
+
+        For solid archives the chain starts from the first file of
+        the solid run.
+        """
+        if not _load_unpack():
+            return None
+        chain = []
+        cur = inf
+        pos = None
+        while 1:
+            if cur.flags & RAR_FILE_PASSWORD or cur.file_redir:
+                return None
+            params = cur._unpack_params()
+            if params is None or params[0] not in rarunpack.SUPPORTED_VERSIONS:
+                return None
+            chain.insert(0, cur)
+            if not cur.flags & RAR_FILE_SOLID:
+                return chain
+
+            # previous file with data in the same solid stream
+            entries = self._info_list if self._solid_list is None else self._solid_list
+            if pos is None:
+                pos = [i for i, m in enumerate(entries) if m is inf]
+                pos = pos[0] if pos else 0
+            while pos > 0:
+                pos -= 1
+                cur = entries[pos]
+                if not cur.isdir() and cur.compress_size and cur.compress_type != RAR_M0:
+                    break
+            else:
+                return chain
+
+    def _single_volume(self):
+        """Whether the archive is fully parsed and does not continue in other volumes."""
+        if not self._parsed or self._main is None or self._main.flags & RAR_MAIN_VOLUME:
+            return False
+        for inf in self._info_list:
+            if inf.flags & (RAR_FILE_SPLIT_BEFORE | RAR_FILE_SPLIT_AFTER):
+                return False
+        return True
+
+    def _is_solid(self):
+        """Whether files continue the compression state of previous ones."""
+        main = self._main
+        if main is None:
+            return False
+        if isinstance(main, Rar5MainInfo):
+            return bool(main.main_flags & RAR5_MAIN_FLAG_SOLID)
+        return bool(main.flags & RAR_MAIN_SOLID)
+
+    def _solid_skip(self, inf, unpacker):
+        """Decompress past an entry of a solid run, keep its data if it fits the cache."""
+        if inf.file_size > SOLID_CACHE_SIZE - self._solid_cache_size:
+            unpacker.skip()
+            return
+        data = unpacker.read(inf.file_size)
+        unpacker.skip()
+        md = (inf._md_class or NoHashContext)()
+        md.update(data)
+        if len(data) != inf.file_size:
+            return
+        if inf._md_expect is not None and md.digest() not in (None, inf._md_expect):
+            return
+        self._solid_cache[id(inf)] = (inf, data)
+        self._solid_cache_size += len(data)
+
     def _open_hack_core(self, inf, psw, prefix, suffix):
 
         size = inf.compress_size + inf.header_size
         rf = XFile(inf.volume_file, 0)
         rf.seek(inf.header_offset)
 
-        tmpfd, tmpname = mkstemp(suffix='.rar')
-        tmpf = os.fdopen(tmpfd, "wb")
+        # the copy holds only this entry, not split over volumes
+        tmpf, tmpname = rar_tempfile(True)
 
         try:
             tmpf.write(prefix)
@@ -1163,18 +1610,19 @@ class CommonParser(object):
         except:
             rf.close()
             tmpf.close()
-            os.unlink(tmpname)
+            remove_tempfile(tmpname)
             raise
 
         return self._open_unrar(tmpname, inf, psw, tmpname)
 
     # write in-memory archive to temp file - needed for solid archives
     def _open_unrar_membuf(self, memfile, inf, psw):
-        tmpname = membuf_tempfile(memfile)
+        tmpname = membuf_tempfile(memfile, self._single_volume())
         return self._open_unrar(tmpname, inf, psw, tmpname, force_file=True)
 
     # extract using unrar
     def _open_unrar(self, rarfile, inf, psw=None, tmpfile=None, force_file=False):
+        _ensure_unrar_tool()
         cmd = [UNRAR_TOOL] + list(OPEN_ARGS)
         add_password_arg(cmd, psw)
         cmd.append("--")
@@ -1196,19 +1644,26 @@ class CommonParser(object):
 
 class Rar3Info(RarInfo):
     """RAR3 specific fields."""
-    extract_version = 15
-    salt = None
-    add_size = 0
-    header_crc = None
-    header_size = None
-    header_offset = None
-    data_offset = None
-    _md_class = None
-    _md_expect = None
-
-    # make sure some rar5 fields are always present
-    file_redir = None
-    blake2sp_hash = None
+    __slots__ = ('type', 'extract_version', 'salt', 'comment', '_arctime')
+
+    def __init__(self):
+        super(Rar3Info, self).__init__()
+        self.type = None
+        self.extract_version = 15
+        self.salt = self.comment = self._arctime = None
+
+    def _load_times(self):
+        """Decode dos time and optional extended times."""
+        stamp, ext = self._times
+        self._times = None
+        self._date_time = parse_dos_time(stamp)
+        if ext is None:
+            self._mtime = self._atime = self._ctime = self._arctime = None
+        else:
+            self._mtime = to_datetime(self._date_time)
+            _parse_ext_time(self, ext, 0)
+
+    arctime = _time_property('_arctime')
 
     def _must_disable_hack(self):
         if self.type == RAR_BLOCK_FILE:
@@ -1221,22 +1676,23 @@ class Rar3Info(RarInfo):
                 return True
         return False
 
+    def _unpack_params(self):
+        """Unpack version and dictionary size."""
+        if self.type != RAR_BLOCK_FILE:
+            return None
+        return self.extract_version, 0x10000 << ((self.flags & RAR_FILE_DICTMASK) >> 5)
+
 
 class RAR3Parser(CommonParser):
     """Parse RAR3 file format.
     """
     _expect_sig = RAR_ID
-    _last_aes_key = (None, None, None)   # (salt, key, iv)
 
     def _decrypt_header(self, fd):
         if not _have_crypto:
             raise NoCrypto('Cannot parse encrypted headers - no crypto')
         salt = fd.read(8)
-        if self._last_aes_key[0] == salt:
-            key, iv = self._last_aes_key[1:]
-        else:
-            key, iv = rar3_s2k(self._password, salt)
-            self._last_aes_key = (salt, key, iv)
+        key, iv = rar3_s2k(self._password, salt)
         return HeaderDecrypt(fd, key, iv)
 
     # common header
@@ -1300,11 +1756,14 @@ class RAR3Parser(CommonParser):
 
         # check crc
         if h.type == RAR_BLOCK_OLD_SUB:
-            crcdat = hdata[2:] + fd.read(h.add_size)
+            crcdat = hdata[2:]
+            subdat = fd.read(h.add_size)
+            calc_crc = rar_crc32(subdat, rar_crc32(crcdat)) & 0xFFFF
+            xlen = len(crcdat) + len(subdat)
         else:
             crcdat = hdata[2:crc_pos]
-
-        calc_crc = rar_crc32(crcdat) & 0xFFFF
+            calc_crc = rar_crc32(crcdat) & 0xFFFF
+            xlen = len(crcdat)
 
         # return good header
         if h.header_crc == calc_crc:
@@ -1312,7 +1771,7 @@ class RAR3Parser(CommonParser):
 
         # header parsing failed.
         self._set_error('Header CRC error (%02x): exp=%x got=%x (xlen = %d)',
-                        h.type, h.header_crc, calc_crc, len(crcdat))
+                        h.type, h.header_crc, calc_crc, xlen)
 
         # instead panicing, send eof
         return None
@@ -1326,8 +1785,6 @@ class RAR3Parser(CommonParser):
         h.file_size = fld[1]
         h.host_os = fld[2]
         h.CRC = fld[3]
-        h.date_time = parse_dos_time(fld[4])
-        h.mtime = to_datetime(h.date_time)
         h.extract_version = fld[5]
         h.compress_type = fld[6]
         name_size = fld[7]
@@ -1343,6 +1800,7 @@ class RAR3Parser(CommonParser):
             h.file_size |= h2 << 32
             h.add_size = h.compress_size
 
+        # filename is decoded right away, member_filter and lookups need it
         name, pos = load_bytes(hdata, name_size, pos)
         if h.flags & RAR_FILE_UNICODE:
             nul = name.find(ZERO)
@@ -1366,11 +1824,13 @@ class RAR3Parser(CommonParser):
         else:
             h.salt = None
 
-        # optional extended time stamps
+        # optional extended time stamps, decoded when used
         if h.flags & RAR_FILE_EXTTIME:
-            pos = _parse_ext_time(h, hdata, pos)
+            end = _skip_ext_time(hdata, pos)
+            h._times = (fld[4], hdata[pos:end])
+            pos = end
         else:
-            h.mtime = h.atime = h.ctime = h.arctime = None
+            h._times = (fld[4], None)
 
         return pos
 
@@ -1436,9 +1896,8 @@ class RAR3Parser(CommonParser):
         if item.type == RAR_BLOCK_FILE:
             # use only first part
             if (item.flags & RAR_FILE_SPLIT_BEFORE) == 0:
-                self._info_map[item.filename] = item
-                self._info_list.append(item)
-            elif len(self._info_list) > 0:
+                self._add_entry(item)
+            elif len(self._info_list) > 0 and not self._skip_last:
                 # final crc is in last block
                 old = self._info_list[-1]
                 old.CRC = item.CRC
@@ -1452,7 +1911,7 @@ class RAR3Parser(CommonParser):
             elif item.flags & RAR_FILE_SOLID:
                 # file comment
                 cmt = self._read_comment_v3(item, self._password)
-                if len(self._info_list) > 0:
+                if len(self._info_list) > 0 and not self._skip_last:
                     old = self._info_list[-1]
                     old.comment = cmt
             else:
@@ -1480,38 +1939,38 @@ class RAR3Parser(CommonParser):
 class Rar5Info(RarInfo):
     """Shared fields for RAR5 records.
     """
+    __slots__ = ('block_type', 'block_flags', 'block_extra_size')
     extract_version = 50
-    header_crc = None
-    header_size = None
-    header_offset = None
-    data_offset = None
-
-    # type=all
-    block_type = None
-    block_flags = None
-    add_size = 0
-    block_extra_size = 0
 
     # type=MAIN
     volume_number = None
-    _md_class = None
-    _md_expect = None
+
+    def __init__(self):
+        super(Rar5Info, self).__init__()
+        self.block_type = self.block_flags = None
+        self.block_extra_size = 0
 
     def _must_disable_hack(self):
         return False
 
+    def _unpack_params(self):
+        """Unpack version and dictionary size."""
+        return None
+
 
 class Rar5BaseFile(Rar5Info):
     """Shared sturct for file & service record.
     """
+    __slots__ = ('file_flags', 'file_encryption', 'file_compress_flags', 'file_host_os',
+                 'file_redir', 'file_owner', 'file_version', 'blake2sp_hash')
     type = -1
-    file_flags = None
-    file_encryption = (0, 0, 0, EMPTY, EMPTY, EMPTY)
-    file_compress_flags = None
-    file_redir = None
-    file_owner = None
-    file_version = None
-    blake2sp_hash = None
+
+    def __init__(self):
+        super(Rar5BaseFile, self).__init__()
+        self.file_flags = self.file_compress_flags = self.file_host_os = None
+        self.file_encryption = (0, 0, 0, EMPTY, EMPTY, EMPTY)
+        self.file_redir = self.file_owner = self.file_version = None
+        self.blake2sp_hash = None
 
     def _must_disable_hack(self):
         if self.flags & RAR_FILE_PASSWORD:
@@ -1524,25 +1983,57 @@ class Rar5BaseFile(Rar5Info):
             return True
         return False
 
+    def _load_times(self):
+        """Decode mtime from file header and times from extra record."""
+        mtime, xtime = self._times
+        self._times = None
+        if mtime is not None:
+            self._mtime, ___ = load_unixtime(S_LONG.pack(mtime), 0)
+            self._date_time = self._mtime.timetuple()[:6]
+        if xtime is not None:
+            tflags, pos = load_vint(xtime, 0)
+            ldr = load_windowstime
+            if tflags & RAR5_XTIME_UNIXTIME:
+                ldr = load_unixtime
+            if tflags & RAR5_XTIME_HAS_MTIME:
+                self._mtime, pos = ldr(xtime, pos)
+                self._date_time = self._mtime.timetuple()[:6]
+            if tflags & RAR5_XTIME_HAS_CTIME:
+                self._ctime, pos = ldr(xtime, pos)
+            if tflags & RAR5_XTIME_HAS_ATIME:
+                self._atime, pos = ldr(xtime, pos)
+
+    def _unpack_params(self):
+        """Unpack version and dictionary size."""
+        flags = self.file_compress_flags
+        return 50 + (flags & 0x3f), 0x20000 << ((flags >> 10) & 0xf)
+
 
 class Rar5FileInfo(Rar5BaseFile):
     """RAR5 file record.
     """
+    __slots__ = ()
     type = RAR_BLOCK_FILE
 
 
 class Rar5ServiceInfo(Rar5BaseFile):
     """RAR5 service record.
     """
+    __slots__ = ()
     type = RAR_BLOCK_SUB
 
 
 class Rar5MainInfo(Rar5Info):
     """RAR5 archive main record.
     """
+    __slots__ = ('main_flags', 'main_volume_number', 'main_qopen_offset',
+                 'main_recovery_offset')
     type = RAR_BLOCK_MAIN
-    main_flags = None
-    main_volume_number = None
+
+    def __init__(self):
+        super(Rar5MainInfo, self).__init__()
+        self.main_flags = self.main_volume_number = None
+        self.main_qopen_offset = self.main_recovery_offset = None
 
     def _must_disable_hack(self):
         if self.main_flags & RAR5_MAIN_FLAG_SOLID:
@@ -1553,12 +2044,14 @@ class Rar5MainInfo(Rar5Info):
 class Rar5EncryptionInfo(Rar5Info):
     """RAR5 archive header encryption record.
     """
+    __slots__ = ('encryption_algo', 'encryption_flags', 'encryption_kdf_count',
+                 'encryption_salt', 'encryption_check_value')
     type = RAR5_BLOCK_ENCRYPTION
-    encryption_algo = None
-    encryption_flags = None
-    encryption_kdf_count = None
-    encryption_salt = None
-    encryption_check_value = None
+
+    def __init__(self):
+        super(Rar5EncryptionInfo, self).__init__()
+        self.encryption_algo = self.encryption_flags = self.encryption_kdf_count = None
+        self.encryption_salt = self.encryption_check_value = None
 
     def needs_password(self):
         return True
@@ -1567,8 +2060,12 @@ class Rar5EncryptionInfo(Rar5Info):
 class Rar5EndArcInfo(Rar5Info):
     """RAR5 end of archive record.
     """
+    __slots__ = ('endarc_flags',)
     type = RAR_BLOCK_ENDARC
-    endarc_flags = None
+
+    def __init__(self):
+        super(Rar5EndArcInfo, self).__init__()
+        self.endarc_flags = None
 
 
 class RAR5Parser(CommonParser):
@@ -1578,19 +2075,18 @@ class RAR5Parser(CommonParser):
     _hdrenc_main = None
 
     # AES encrypted headers
-    _last_aes256_key = (-1, None, None)   # (kdf_count, salt, key)
-
     def _gen_key(self, kdf_count, salt):
-        if self._last_aes256_key[:2] == (kdf_count, salt):
-            return self._last_aes256_key[2]
-        if kdf_count > 24:
-            raise BadRarFile('Too large kdf_count')
         psw = self._password
         if isinstance(psw, unicode):
             psw = psw.encode('utf8')
-        key = pbkdf2_sha256(psw, salt, 1 << kdf_count)
-        self._last_aes256_key = (kdf_count, salt, key)
-        return key
+        ident = _key_ident(b'rar5', pack('<B', kdf_count & 0xff), salt, psw)
+        res = _key_cache_get(ident)
+        if res is None:
+            if kdf_count > 24:
+                raise BadRarFile('Too large kdf_count')
+            res = (pbkdf2_sha256(psw, salt, 1 << kdf_count),)
+            _key_cache_put(ident, res)
+        return res[0]
 
     def _decrypt_header(self, fd):
         if not _have_crypto:
@@ -1600,6 +2096,55 @@ class RAR5Parser(CommonParser):
         iv = fd.read(16)
         return HeaderDecrypt(fd, key, iv)
 
+    # headers from quick open record, unless reaching the record
+    # means reading the whole archive
+    def _quick_open(self, fd, main):
+        if (not USE_QUICK_OPEN or not main.main_qopen_offset or self._hdrenc_main
+                or isinstance(self._rarfile, SpoolFile)):
+            return fd
+        pos = fd.tell()
+        error = self._parse_error
+        try:
+            headers = self._load_quick_open(fd, main.header_offset + main.main_qopen_offset)
+        except (BadRarFile, struct.error):
+            headers = None
+        # damaged record is not an archive error, headers are read in place then
+        self._parse_error = error
+        fd.seek(pos, 0)
+        if not headers:
+            return fd
+        return QuickOpenFile(fd, headers)
+
+    def _load_quick_open(self, fd, qo_pos):
+        fd.seek(qo_pos, 0)
+        h = self._parse_block_header(fd)
+        if (not h or h.block_type != RAR5_BLOCK_SERVICE or h.filename != 'QO'
+                or h.compress_type != RAR_M0 or h.flags & (RAR_FILE_PASSWORD | RAR_FILE_SPLIT_AFTER)):
+            return None
+        data = fd.read(h.add_size)
+        if len(data) != h.add_size:
+            return None
+        if h._md_expect is not None and h._md_class(data).digest() != h._md_expect:
+            return None
+
+        # crc, size, flags, offset back from quick open header, header size, header
+        headers = {}
+        pos = 0
+        while pos < len(data):
+            crc, start = load_le32(data, pos)
+            size, pos = load_vint(data, start)
+            end = pos + size
+            if end > len(data) or rar_crc32(data[start:end]) != crc:
+                return None
+            ___flags, pos = load_vint(data, pos)
+            offset, pos = load_vint(data, pos)
+            hdr, pos = load_vstr(data, pos)
+            if offset > qo_pos or pos > end:
+                return None
+            headers[qo_pos - offset] = hdr
+            pos = end
+        return headers
+
     # common header
     def _parse_block_header(self, fd):
         header_offset = fd.tell()
@@ -1673,7 +2218,7 @@ class RAR5Parser(CommonParser):
     def _parse_main_block(self, h, hdata, pos):
         h.main_flags, pos = load_vint(hdata, pos)
         if h.main_flags & RAR5_MAIN_FLAG_HAS_VOLNR:
-            h.main_volume_number = load_vint(hdata, pos)
+            h.main_volume_number, pos = load_vint(hdata, pos)
 
         h.flags |= RAR_MAIN_NEWNUMBERING
         if h.main_flags & RAR5_MAIN_FLAG_SOLID:
@@ -1687,16 +2232,37 @@ class RAR5Parser(CommonParser):
         if h.main_flags & RAR5_MAIN_FLAG_HAS_VOLNR == 0:
             h.flags |= RAR_MAIN_FIRSTVOLUME
 
+        if h.block_extra_size:
+            # allow 1 byte of garbage
+            while pos < len(hdata) - 1:
+                xsize, pos = load_vint(hdata, pos)
+                xdata, pos = load_bytes(hdata, xsize, pos)
+                self._process_main_extra(h, xdata)
+
         return h
 
+    # main extra record
+    def _process_main_extra(self, h, xdata):
+        xtype, pos = load_vint(xdata, 0)
+        if xtype == RAR5_XMAIN_LOCATOR:
+            self._parse_main_locator(h, xdata, pos)
+
+    # offsets of quick open and recovery records from main header
+    def _parse_main_locator(self, h, xdata, pos):
+        flags, pos = load_vint(xdata, pos)
+        if flags & RAR5_XLOCATOR_QOPEN:
+            h.main_qopen_offset, pos = load_vint(xdata, pos)
+        if flags & RAR5_XLOCATOR_RECOVERY:
+            h.main_recovery_offset, pos = load_vint(xdata, pos)
+
     def _parse_file_block(self, h, hdata, pos):
         h.file_flags, pos = load_vint(hdata, pos)
         h.file_size, pos = load_vint(hdata, pos)
         h.mode, pos = load_vint(hdata, pos)
 
         if h.file_flags & RAR5_FILE_FLAG_HAS_MTIME:
-            h.mtime, pos = load_unixtime(hdata, pos)
-            h.date_time = h.mtime.timetuple()[:6]
+            mtime, pos = load_le32(hdata, pos)
+            h._times = (mtime, None)
         if h.file_flags & RAR5_FILE_FLAG_HAS_CRC32:
             h.CRC, pos = load_le32(hdata, pos)
             h._md_class = CRC32Context
@@ -1714,7 +2280,9 @@ class RAR5Parser(CommonParser):
             h.host_os = RAR_OS_UNIX
         h.compress_type = RAR_M0 + ((h.file_compress_flags >> 7) & 7)
 
-        if h.block_extra_size:
+        # extra records of filtered files are not needed, except in solid runs
+        if h.block_extra_size and (h.block_type != RAR5_BLOCK_FILE or self._is_solid()
+                                   or self._wanted(h)):
             # allow 1 byte of garbage
             while pos < len(hdata) - 1:
                 xsize, pos = load_vint(hdata, pos)
@@ -1770,19 +2338,17 @@ class RAR5Parser(CommonParser):
         else:
             pass
 
-    # extra block for file time record
+    # extra block for file time record, decoded when used
     def _parse_file_xtime(self, h, xdata, pos):
-        tflags, pos = load_vint(xdata, pos)
-        ldr = load_windowstime
-        if tflags & RAR5_XTIME_UNIXTIME:
-            ldr = load_unixtime
-        if tflags & RAR5_XTIME_HAS_MTIME:
-            h.mtime, pos = ldr(xdata, pos)
-            h.date_time = h.mtime.timetuple()[:6]
-        if tflags & RAR5_XTIME_HAS_CTIME:
-            h.ctime, pos = ldr(xdata, pos)
-        if tflags & RAR5_XTIME_HAS_ATIME:
-            h.atime, pos = ldr(xdata, pos)
+        tflags, end = load_vint(xdata, pos)
+        size = 4 if tflags & RAR5_XTIME_UNIXTIME else 8
+        for flag in (RAR5_XTIME_HAS_MTIME, RAR5_XTIME_HAS_CTIME, RAR5_XTIME_HAS_ATIME):
+            if tflags & flag:
+                end += size
+        if end > len(xdata):
+            raise BadRarFile('cannot load xtime')
+        mtime = h._times[0] if h._times else None
+        h._times = (mtime, xdata[pos:end])
 
     # just remember encryption info
     def _parse_file_encryption(self, h, xdata, pos):
@@ -1840,9 +2406,8 @@ class RAR5Parser(CommonParser):
         if item.block_type == RAR5_BLOCK_FILE:
             # use only first part
             if (item.block_flags & RAR5_BLOCK_FLAG_SPLIT_BEFORE) == 0:
-                self._info_map[item.filename] = item
-                self._info_list.append(item)
-            elif len(self._info_list) > 0:
+                self._add_entry(item)
+            elif len(self._info_list) > 0 and not self._skip_last:
                 # final crc is in last block
                 old = self._info_list[-1]
                 old.CRC = item.CRC
@@ -2195,10 +2760,7 @@ class PipeReader(RarExtFile):
         super(PipeReader, self).close()
 
         if self._tempfile:
-            try:
-                os.unlink(self._tempfile)
-            except OSError:
-                pass
+            remove_tempfile(self._tempfile)
             self._tempfile = None
 
     def readinto(self, buf):
@@ -2218,6 +2780,29 @@ class PipeReader(RarExtFile):
         return got
 
 
+class PipePartReader(PipeReader):
+    """Read one entry from the output of unrar run that prints several.
+
+    The pipe is shared with the readers of the other entries, so it
+    cannot be rewound.
+    """
+
+    def __init__(self, rf, inf, pipe):
+        self._pipe = pipe
+        super(PipePartReader, self).__init__(rf, inf, None)
+
+    def _open(self):
+        if self._fd:
+            raise NotImplementedError("Cannot rewind shared unrar output")
+        RarExtFile._open(self)
+        self._fd = self._pipe
+
+    def close(self):
+        """Leave the pipe open for the next entry."""
+        self._fd = None
+        super(PipePartReader, self).close()
+
+
 class DirectReader(RarExtFile):
     """Read uncompressed data directly from archive.
     """
@@ -2342,12 +2927,107 @@ class DirectReader(RarExtFile):
         return got
 
 
+class UnpackReader(RarExtFile):
+    """Decompress data in-process, without unrar.
+
+    Files of a solid archive are decompressed starting from the
+    first file of the solid run, or from where the previously read
+    file of the run ended.  Files passed on the way are kept in
+    the parser's solid cache.
+    """
+    _unpacker = None
+
+    def __init__(self, parser, inf, chain):
+        self._chain = chain
+        super(UnpackReader, self).__init__(parser, inf)
+
+    def _open(self):
+        super(UnpackReader, self)._open()
+
+        # continue after a file read earlier from the same run
+        start = 0
+        resume, self._parser._solid_resume = self._parser._solid_resume, None
+        if resume:
+            for i, inf in enumerate(self._chain[:-1]):
+                if inf is resume[1]:
+                    self._unpacker, start = resume[0], i + 1
+                    break
+        if not start:
+            version, winsize = self._inf._unpack_params()
+            self._unpacker = rarunpack.new_unpacker(version, winsize)
+        try:
+            for i in range(start, len(self._chain)):
+                inf = self._chain[i]
+                if self._fd:
+                    self._fd.close()
+                self._fd = DirectReader(self._parser, inf)
+                self._unpacker.begin(self._fd._read, inf.file_size, inf.compress_size, i > 0)
+                if inf is not self._inf:
+                    self._parser._solid_skip(inf, self._unpacker)
+        except rarunpack.UnpackError as ex:
+            raise BadRarFile('%s: %s' % (self._inf.filename, ex))
+
+    def read(self, cnt=None):
+        """Read all or specified amount of data from archive entry."""
+        data = super(UnpackReader, self).read(cnt)
+        if self._remain == 0 and self._unpacker and self._parser._is_solid():
+            # next file of the solid run can continue from here
+            try:
+                self._unpacker.skip()
+            except rarunpack.UnpackError as ex:
+                raise BadRarFile('%s: %s' % (self._inf.filename, ex))
+            self._parser._solid_resume = (self._unpacker, self._inf)
+            self._unpacker = None
+        return data
+
+    def _read(self, cnt):
+        """Decompress more data."""
+        try:
+            return self._unpacker.read(cnt)
+        except rarunpack.UnpackError as ex:
+            raise BadRarFile('%s: %s' % (self._inf.filename, ex))
+
+    def readinto(self, buf):
+        """Read into buffer."""
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class MemoryReader(RarExtFile):
+    """Serve data decompressed earlier.
+    """
+
+    def __init__(self, parser, inf, data):
+        self._data = data
+        super(MemoryReader, self).__init__(parser, inf)
+
+    def _open(self):
+        super(MemoryReader, self)._open()
+        self._fd = BytesIO(self._data)
+
+    def _read(self, cnt):
+        """Read from buffer."""
+        return self._fd.read(cnt)
+
+    def readinto(self, buf):
+        """Read into buffer."""
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
 class HeaderDecrypt(object):
-    """File-like object that decrypts from another file"""
+    """File-like object that decrypts from another file.
+
+    Each read fetches and decrypts all blocks it needs with one cipher call,
+    nothing is read ahead as the next header has its own IV.
+    """
     def __init__(self, f, key, iv):
         self.f = f
         self.ciph = AES_CBC_Decrypt(key, iv)
         self.buf = EMPTY
+        self.pos = 0
 
     def tell(self):
         """Current file pos - works only on block boundaries."""
@@ -2359,30 +3039,96 @@ class HeaderDecrypt(object):
             raise BadRarFile('Bad count to header decrypt - wrong password?')
 
         # consume old data
-        if cnt <= len(self.buf):
-            res = self.buf[:cnt]
-            self.buf = self.buf[cnt:]
-            return res
-        res = self.buf
-        self.buf = EMPTY
-        cnt -= len(res)
+        pos = self.pos
+        avail = len(self.buf) - pos
+        if cnt <= avail:
+            self.pos = pos + cnt
+            return self.buf[pos : pos + cnt]
+
+        # decrypt whole blocks, partial one at EOF is dropped
+        cnt -= avail
+        enc = self.f.read((cnt + 15) & ~15)
+        enc = enc[: len(enc) & ~15]
+        dec = self.ciph.decrypt(enc) if enc else EMPTY
+        res = self.buf[pos:] + dec[:cnt]
+        self.buf = dec
+        self.pos = min(cnt, len(dec))
+        return res
 
-        # decrypt new data
-        blklen = 16
-        while cnt > 0:
-            enc = self.f.read(blklen)
-            if len(enc) < blklen:
+
+class SpoolFile(object):
+    """Seekable file object over a non-seekable byte source.
+
+    Data is copied into a spool file as it is read from the source.
+    Reading past the spooled data blocks until the source delivers it.
+    """
+
+    def __init__(self, source, spool=None):
+        """Wrap source, spool into given file object or anonymous temp file."""
+        self._source = source
+        self._spool = spool if spool is not None else TemporaryFile()
+        self._size = 0
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, end=None):
+        if self._eof or (end is not None and end <= self._size):
+            return
+        self._spool.seek(self._size)
+        while end is None or self._size < end:
+            buf = self._source.read(BSIZE)
+            if not buf:
+                self._eof = True
                 break
-            dec = self.ciph.decrypt(enc)
-            if cnt >= len(dec):
-                res += dec
-                cnt -= len(dec)
-            else:
-                res += dec[:cnt]
-                self.buf = dec[cnt:]
-                cnt = 0
+            self._spool.write(buf)
+            self._size += len(buf)
 
-        return res
+    def read(self, n=None):
+        """Read from current position."""
+        if n is None or n < 0:
+            self._fill()
+            end = self._size
+        else:
+            self._fill(self._pos + n)
+            end = min(self._pos + n, self._size)
+        if end <= self._pos:
+            return EMPTY
+        self._spool.seek(self._pos)
+        data = self._spool.read(end - self._pos)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, dst):
+        """Read into buffer."""
+        data = self.read(len(dst))
+        dst[:len(data)] = data
+        return len(data)
+
+    def tell(self):
+        """Return file pos."""
+        return self._pos
+
+    def seek(self, ofs, whence=0):
+        """Move file pos."""
+        if whence == 1:
+            ofs += self._pos
+        elif whence == 2:
+            self._fill()
+            ofs += self._size
+        self._pos = max(ofs, 0)
+        return self._pos
+
+    def getvalue(self):
+        """Read rest of source, return whole content."""
+        self._fill()
+        self._spool.seek(0)
+        return self._spool.read()
+
+    def close(self):
+        """Close spool file and source."""
+        self._spool.close()
+        if hasattr(self._source, 'close'):
+            self._source.close()
 
 
 # handle (filename|filelike) object
@@ -2428,6 +3174,68 @@ class XFile(object):
         self.close()
 
 
+class QuickOpenFile(object):
+    """Archive file with copies of some of its headers.
+
+    Reads at positions of copied headers are served from the copies,
+    anything else from the file itself.
+    """
+    __slots__ = ('_fd', '_headers', '_cur', '_pos')
+
+    def __init__(self, fd, headers):
+        """Wrap fd, headers maps file position to header bytes."""
+        self._fd = fd
+        self._headers = headers
+        self._cur = (0, EMPTY)
+        self._pos = fd.tell()
+
+    def _copy(self):
+        """Rest of header copy from current position, None if not copied."""
+        start, hdr = self._cur
+        if not start <= self._pos < start + len(hdr):
+            hdr = self._headers.get(self._pos)
+            if hdr is None:
+                return None
+            start = self._pos
+            self._cur = (start, hdr)
+        return hdr[self._pos - start:]
+
+    def read(self, n=None):
+        """Read from file."""
+        res = self._copy()
+        if res is None:
+            self._fd.seek(self._pos, 0)
+            res = self._fd.read(n)
+        elif n is None or n < 0:
+            self._fd.seek(self._pos + len(res), 0)
+            res += self._fd.read()
+        elif n > len(res):
+            self._fd.seek(self._pos + len(res), 0)
+            res += self._fd.read(n - len(res))
+        else:
+            res = res[:n]
+        self._pos += len(res)
+        return res
+
+    def tell(self):
+        """Return file pos."""
+        return self._pos
+
+    def seek(self, ofs, whence=0):
+        """Move file pos."""
+        if whence == 1:
+            ofs += self._pos
+        elif whence == 2:
+            self._fd.seek(ofs, 2)
+            ofs = self._fd.tell()
+        self._pos = ofs
+        return ofs
+
+    def close(self):
+        """Close file object."""
+        self._fd.close()
+
+
 class NoHashContext(object):
     """No-op hash function."""
     def __init__(self, data=None):
@@ -2491,6 +3299,21 @@ class Blake2SP(object):
         self._thread[self._cur].update(blk)
         self._cur = (self._cur + 1) % self.parallelism
 
+    def _add_stripes(self, view):
+        """Hash whole stripes of blocks, one task per lane.
+        """
+        tasks = []
+        for i in range(self.parallelism):
+            ctx = self._thread[(self._cur + i) % self.parallelism]
+            tasks.append((_blake2sp_lane, ctx, view, i))
+        # whole stripes leave self._cur where it was
+        workers = 0
+        if len(view) >= BLAKE2SP_THREAD_SIZE:
+            workers = BLAKE2SP_THREADS
+            if workers is None:
+                workers = min(_cpu_count(), self.parallelism)
+        _run_threaded(tasks, workers)
+
     def update(self, data):
         """Hash data.
         """
@@ -2503,6 +3326,11 @@ class Blake2SP(object):
                 return
             self._add_block(self._buf + view[:need].tobytes())
             view = view[need:]
+        stripe = bs * self.parallelism
+        if len(view) >= max(BLAKE2SP_BULK_SIZE, stripe):
+            n = len(view) - len(view) % stripe
+            self._add_stripes(view[:n])
+            view = view[n:]
         while len(view) >= bs:
             self._add_block(view[:bs])
             view = view[bs:]
@@ -2525,6 +3353,78 @@ class Blake2SP(object):
         """Hexadecimal digest."""
         return tohex(self.digest())
 
+def _blake2sp_lane(ctx, view, lane):
+    """Hash every 8th block of view into ctx, starting from block lane.
+    """
+    bs = Blake2SP.block_size
+    stripe = bs * Blake2SP.parallelism
+    if hasattr(view, 'cast'):
+        # copy the lane's blocks as 8-byte words, one strided copy per word of a block
+        words = view.cast('B').cast('Q')
+        buf = bytearray(len(view) // Blake2SP.parallelism)
+        dst = memoryview(buf).cast('Q')
+        step = bs // 8
+        for i in range(step):
+            dst[i::step] = words[lane * step + i::stripe // 8]
+    else:
+        buf = EMPTY.join([view[pos : pos + bs].tobytes()
+                          for pos in range(lane * bs, len(view), stripe)])
+    # hashlib releases the GIL here, so lanes in other threads can proceed
+    ctx.update(buf)
+
+_cpu_count_cached = None
+
+def _cpu_count():
+    global _cpu_count_cached
+    if _cpu_count_cached is None:
+        try:
+            from multiprocessing import cpu_count
+            _cpu_count_cached = cpu_count()
+        except (ImportError, NotImplementedError):
+            _cpu_count_cached = 1
+    return _cpu_count_cached
+
+# worker threads for _run_threaded()
+_task_queue = None
+_task_threads = []
+
+def _task_worker(queue):
+    while True:
+        func, args, done = queue.get()
+        try:
+            func(*args)
+            done.put(None)
+        except Exception:
+            done.put(sys.exc_info()[1])
+
+def _run_threaded(tasks, workers):
+    """Run (func, args...) tasks in up to workers threads and wait for all of them.
+    """
+    global _task_queue
+    if workers < 2:
+        for task in tasks:
+            task[0](*task[1:])
+        return
+    try:
+        from queue import Queue
+    except ImportError:
+        from Queue import Queue
+    import threading
+    if _task_queue is None:
+        _task_queue = Queue()
+    while len(_task_threads) < workers:
+        thread = threading.Thread(target=_task_worker, args=(_task_queue,))
+        thread.daemon = True
+        thread.start()
+        _task_threads.append(thread)
+    done = Queue()
+    for task in tasks:
+        _task_queue.put((task[0], task[1:], done))
+    errors = [done.get() for _ in tasks]
+    for err in errors:
+        if err is not None:
+            raise err
+
 ##
 ## Utility functions
 ##
@@ -2627,6 +3527,22 @@ def _inc_volname(volfile, i):
     return ''.join(fn)
 
 # rar3 extended time fields
+def _skip_ext_time(data, pos):
+    """Find end of rar3 extended time fields without decoding them."""
+    if pos + 2 > len(data):
+        return pos
+    flags = S_SHORT.unpack_from(data, pos)[0]
+    pos += 2
+    # mtime, ctime, atime, arctime - mtime has its base time in file header
+    for i in range(4):
+        flag = flags >> (3 - i) * 4
+        if flag & 8:
+            pos += (4 if i else 0) + (flag & 3)
+    if pos > len(data):
+        # broken header, like a short read of the header fields
+        raise struct.error('cannot load ext time')
+    return pos
+
 def _parse_ext_time(h, data, pos):
     # flags and rest of data can be missing
     flags = 0
@@ -2669,6 +3585,25 @@ def _parse_xtime(flag, data, pos, basetime=None):
             res = basetime.replace(microsecond=usec)
     return res, pos
 
+def _member_predicate(member_filter):
+    """Function for RarFile member_filter, None if not filtering.
+    """
+    if member_filter is None or callable(member_filter):
+        return member_filter
+    if isinstance(member_filter, (str, unicode)):
+        suffixes = (member_filter,)
+    else:
+        suffixes = tuple(member_filter)
+    return lambda name: name.endswith(suffixes)
+
+def is_seekable(obj):
+    """File object supports seeking?
+    """
+    seekable = getattr(obj, 'seekable', None)
+    if seekable is not None:
+        return seekable()
+    return hasattr(obj, 'seek')
+
 def is_filelike(obj):
     """Filename or file object?
     """
@@ -2687,17 +3622,109 @@ def rar3_s2k(psw, salt):
     if not isinstance(psw, unicode):
         psw = psw.decode('utf8')
     seed = psw.encode('utf-16le') + salt
-    iv = EMPTY
+    ident = _key_ident(b'rar3', seed)
+    res = _key_cache_get(ident)
+    if res is None:
+        res = _rar3_s2k(seed)
+        _key_cache_put(ident, res)
+    return res
+
+def _rar3_s2k(seed):
+    """Hash seed followed by 3-byte counter, 0x40000 times.
+
+    The records of one 0x4000 round are laid out in a buffer and hashed
+    with one call, only the counter columns change between rounds.
+    """
+    nrec = 0x4000
+    slen = len(seed)
+    reclen = slen + 3
+    buf = bytearray(reclen * nrec)
+    for k in range(slen):
+        buf[k::reclen] = seed[k : k + 1] * nrec
+    buf[slen::reclen] = bytearray(range(256)) * (nrec // 256)
+    view = memoryview(buf)
+    iv = []
     h = sha1()
     for i in range(16):
-        for j in range(0x4000):
-            cnt = S_LONG.pack(i * 0x4000 + j)
-            h.update(seed + cnt[:3])
-            if j == 0:
-                iv += h.digest()[19:20]
+        # counter is i * 0x4000 + j, little-endian
+        buf[slen + 1::reclen] = EMPTY.join([bytes(bytearray([(i << 6 | j) & 0xff])) * 256
+                                           for j in range(nrec // 256)])
+        buf[slen + 2::reclen] = bytes(bytearray([i >> 2])) * nrec
+        h.update(view[:reclen])
+        iv.append(h.digest()[19:20])
+        h.update(view[reclen:])
     key_be = h.digest()[:16]
     key_le = pack("<LLLL", *unpack(">LLLL", key_be))
-    return key_le, iv
+    return key_le, EMPTY.join(iv)
+
+# derived keys, ident -> tuple of keys, least recently used first
+_key_cache = None
+_key_cache_file = None
+
+def _key_ident(*parts):
+    """Cache key for KDF input, so passwords are not kept around.
+    """
+    h = sha256()
+    for part in parts:
+        h.update(S_LONG.pack(len(part)))
+        h.update(part)
+    return h.hexdigest()
+
+def _key_cache_load():
+    """In-memory cache, filled from KEY_CACHE_FILE on first use.
+    """
+    global _key_cache, _key_cache_file
+    if _key_cache is not None and _key_cache_file == KEY_CACHE_FILE:
+        return _key_cache
+    from collections import OrderedDict
+    _key_cache = OrderedDict()
+    _key_cache_file = KEY_CACHE_FILE
+    data = _read_json(KEY_CACHE_FILE) if KEY_CACHE_FILE else None
+    if isinstance(data, list):
+        try:
+            for ident, keys in data:
+                _key_cache[str(ident)] = tuple(unhexlify(k) for k in keys)
+        except (TypeError, ValueError):
+            _key_cache.clear()
+    return _key_cache
+
+def _key_cache_get(ident):
+    """Derived keys for ident, None if not known.
+    """
+    cache = _key_cache_load()
+    res = cache.pop(ident, None)
+    if res is not None:
+        cache[ident] = res
+    return res
+
+def _key_cache_put(ident, keys):
+    """Remember derived keys, dropping least recently used ones.
+    """
+    cache = _key_cache_load()
+    cache.pop(ident, None)
+    cache[ident] = keys
+    while len(cache) > max(KEY_CACHE_SIZE, 0):
+        cache.popitem(last=False)
+    if KEY_CACHE_FILE:
+        data = [[i, [hexlify(k).decode('ascii') for k in v]] for i, v in cache.items()]
+        _write_json(KEY_CACHE_FILE, data)
+
+def _load_unpack():
+    """Return rarunpack if in-process decompression is enabled and available.
+
+    The module is under the UnRAR license, so it is not imported
+    unless USE_PYTHON_UNPACK asks for it.
+    """
+    global rarunpack
+    if not USE_PYTHON_UNPACK:
+        return None
+    if rarunpack is None:
+        try:
+            import rarunpack as mod
+        except ImportError:
+            return None
+        rarunpack = mod
+    return rarunpack
 
 def rar3_decompress(vers, meth, data, declen=0, flags=0, crc=0, psw=None, salt=None):
     """Decompress blob of compressed data.
@@ -2712,6 +3739,16 @@ def rar3_decompress(vers, meth, data, declen=0, flags=0, crc=0, psw=None, salt=N
     flags = flags & (RAR_FILE_PASSWORD | RAR_FILE_SALT | RAR_FILE_DICTMASK)
     flags |= RAR_LONG_BLOCK
 
+    # no need for temp archive
+    if not flags & RAR_FILE_PASSWORD and _load_unpack():
+        unp = rarunpack.new_unpacker(vers, 0x10000 << ((flags & RAR_FILE_DICTMASK) >> 5))
+        if unp:
+            try:
+                unp.begin(BytesIO(data).read, declen, len(data))
+                return unp.read(declen)
+            except rarunpack.UnpackError:
+                return EMPTY
+
     # file header
     fname = b'data'
     date = 0
@@ -2734,12 +3771,12 @@ def rar3_decompress(vers, meth, data, declen=0, flags=0, crc=0, psw=None, salt=N
     mh = S_BLK_HDR.pack(0x90CF, RAR_BLOCK_MAIN, 0, 13) + ZERO * (2 + 4)
 
     # decompress via temp rar
-    tmpfd, tmpname = mkstemp(suffix='.rar')
-    tmpf = os.fdopen(tmpfd, "wb")
+    tmpf, tmpname = rar_tempfile(True)
     try:
         tmpf.write(RAR_ID + mh + hdr + data)
         tmpf.close()
 
+        _ensure_unrar_tool()
         cmd = [UNRAR_TOOL] + list(OPEN_ARGS)
         add_password_arg(cmd, psw, (flags & RAR_FILE_PASSWORD))
         cmd.append(tmpname)
@@ -2748,7 +3785,7 @@ def rar3_decompress(vers, meth, data, declen=0, flags=0, crc=0, psw=None, salt=N
         return p.communicate()[0]
     finally:
         tmpf.close()
-        os.unlink(tmpname)
+        remove_tempfile(tmpname)
 
 def to_datetime(t):
     """Convert 6-part time tuple into datetime object.
@@ -2807,10 +3844,16 @@ def custom_popen(cmd):
     if sys.platform == 'win32':
         creationflags = 0x08000000   # CREATE_NO_WINDOW
 
+    # in-memory archives must stay open in the child
+    kwargs = {}
+    fds = tuple(_memfd_files[arg] for arg in cmd if arg in _memfd_files)
+    if fds and sys.hexversion >= 0x3020000:
+        kwargs['pass_fds'] = fds
+
     # run command
     try:
         p = Popen(cmd, bufsize=0, stdout=PIPE, stdin=PIPE, stderr=STDOUT,
-                  creationflags=creationflags)
+                  creationflags=creationflags, **kwargs)
     except OSError as ex:
         if ex.errno == errno.ENOENT:
             raise RarCannotExec("Unrar not installed? (rarfile.UNRAR_TOOL=%r)" % UNRAR_TOOL)
@@ -2826,6 +3869,18 @@ def custom_check(cmd, ignore_retcode=False):
         raise RarExecError("Check-run failed")
     return out
 
+def _tool_filename(fn):
+    """Filename as unrar expects it on command line, None if it cannot be passed.
+    """
+    if PATH_SEP != os.sep:
+        fn = fn.replace(PATH_SEP, os.sep)
+    if sys.hexversion < 0x3000000 and isinstance(fn, unicode):
+        try:
+            fn = fn.encode(sys.getfilesystemencoding() or 'ascii')
+        except UnicodeError:
+            return None
+    return fn
+
 def add_password_arg(cmd, psw, ___required=False):
     """Append password switch to commandline.
     """
@@ -2871,12 +3926,74 @@ def hmac_sha256(key, data):
     """HMAC-SHA256"""
     return HMAC(key, data, sha256).digest()
 
-def membuf_tempfile(memfile):
+# memfd descriptors behind the /proc/self/fd names given out by rar_tempfile()
+_memfd_files = {}
+_memfd_func = None
+
+def _memfd_create(name):
+    """Anonymous in-memory file, None if not supported.
+    """
+    global _memfd_func
+    if _memfd_func is None:
+        _memfd_func = False
+        if sys.platform.startswith('linux') and os.path.isdir('/proc/self/fd'):
+            if hasattr(os, 'memfd_create'):
+                _memfd_func = lambda nm: os.memfd_create(nm, os.MFD_CLOEXEC)
+            else:
+                try:
+                    import ctypes
+                    func = ctypes.CDLL(None, use_errno=True).memfd_create
+                    # without pass_fds the descriptor must survive exec by default
+                    _memfd_func = lambda nm: func(nm.encode('ascii'), 0)
+                except (ImportError, OSError, AttributeError):
+                    pass
+    if not _memfd_func:
+        return None
+    try:
+        fd = _memfd_func(name)
+    except OSError:
+        return None
+    return fd if fd >= 0 else None
+
+def rar_tempfile(single=False):
+    """Create file for temporary archive, return (fileobj, name).
+
+    On Linux an archive that is known to be single volume stays in
+    memory and unrar opens it via /proc/self/fd.  Otherwise it goes
+    to TMPFS_DIR if that is usable or to the system temp directory,
+    as unrar looks for next volumes by numbering up the name, which
+    would find other descriptors.  Release it with
+    :func:`remove_tempfile`.
+    """
+    if USE_MEMFD and single:
+        fd = _memfd_create('rarfile')
+        if fd is not None:
+            name = '/proc/self/fd/%d' % fd
+            _memfd_files[name] = fd
+            return os.fdopen(os.dup(fd), 'wb'), name
+
+    tmpdir = None
+    if TMPFS_DIR and os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+        tmpdir = TMPFS_DIR
+    tmpfd, tmpname = mkstemp(suffix='.rar', dir=tmpdir)
+    return os.fdopen(tmpfd, 'wb'), tmpname
+
+def remove_tempfile(name):
+    """Release temporary archive created by :func:`rar_tempfile`."""
+    fd = _memfd_files.pop(name, None)
+    if fd is not None:
+        os.close(fd)
+        return
+    try:
+        os.unlink(name)
+    except OSError:
+        pass
+
+def membuf_tempfile(memfile, single=False):
     """Write in-memory file object to real file."""
     memfile.seek(0, 0)
 
-    tmpfd, tmpname = mkstemp(suffix='.rar')
-    tmpf = os.fdopen(tmpfd, "wb")
+    tmpf, tmpname = rar_tempfile(single)
 
     try:
         while True:
@@ -2887,7 +4004,7 @@ def membuf_tempfile(memfile):
         tmpf.close()
     except:
         tmpf.close()
-        os.unlink(tmpname)
+        remove_tempfile(tmpname)
         raise
     return tmpname
 
@@ -2896,9 +4013,9 @@ class XTempFile(object):
     """
     __slots__ = ('_tmpfile', '_filename')
 
-    def __init__(self, rarfile):
+    def __init__(self, rarfile, single=False):
         if is_filelike(rarfile):
-            self._tmpfile = membuf_tempfile(rarfile)
+            self._tmpfile = membuf_tempfile(rarfile, single)
             self._filename = self._tmpfile
         else:
             self._tmpfile = None
@@ -2909,10 +4026,7 @@ class XTempFile(object):
 
     def __exit__(self, exc_type, exc_value, tb):
         if self._tmpfile:
-            try:
-                os.unlink(self._tmpfile)
-            except OSError:
-                pass
+            remove_tempfile(self._tmpfile)
             self._tmpfile = None
 
 #
@@ -2924,28 +4038,153 @@ ORIG_OPEN_ARGS = OPEN_ARGS
 ORIG_EXTRACT_ARGS = EXTRACT_ARGS
 ORIG_TEST_ARGS = TEST_ARGS
 
-def _check_unrar_tool():
-    global UNRAR_TOOL, OPEN_ARGS, EXTRACT_ARGS, TEST_ARGS
+# result of tool detection, None until the first operation that needs a tool
+_tool_info = None
+
+def _which(name):
+    """Full path of program as found in PATH, None if not found.
+    """
+    if os.path.dirname(name):
+        return name if os.path.isfile(name) else None
+    exts = ['']
+    if sys.platform == 'win32':
+        exts += os.environ.get('PATHEXT', '.EXE').lower().split(os.pathsep)
+    for dn in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        for ext in exts:
+            fn = os.path.join(dn or os.curdir, name + ext)
+            if os.path.isfile(fn) and os.access(fn, os.X_OK):
+                return fn
+    return None
+
+def _tool_stamp(name):
+    """Location and mtime of program, detection result depends only on these.
+    """
+    fn = _which(name)
+    if fn is None:
+        return None
+    try:
+        return [fn, os.stat(fn).st_mtime]
+    except OSError:
+        return None
+
+def _tool_version(out):
+    """Version number from tool banner.
+    """
+    if not isinstance(out, unicode):
+        out = out.decode('latin1')
+    # 'UNRAR 5.80 freeware ...' or 'bsdtar 3.7.7 - libarchive ...'
+    for ln in out.splitlines():
+        words = ln.split()
+        if len(words) > 1 and words[0].isalpha() and words[1][:1].isdigit():
+            return words[1]
+    return None
+
+def _read_json(fname):
+    """Load JSON file, None if missing or broken.
+    """
+    import json
+    try:
+        with open(fname, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+def _write_json(fname, data):
+    """Replace JSON file atomically, readable only by owner.
+    """
+    import json
+    tmpname = '%s.%d.tmp' % (fname, os.getpid())
+    try:
+        with os.fdopen(os.open(tmpname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(data, f)
+        if sys.platform == 'win32' and os.path.exists(fname):
+            os.unlink(fname)
+        os.rename(tmpname, fname)
+    except (IOError, OSError, ValueError):
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+
+def _load_tool_info(key):
+    """Detection result remembered in TOOL_CACHE_FILE, if still valid.
+    """
+    if not TOOL_CACHE_FILE:
+        return None
+    info = _read_json(TOOL_CACHE_FILE)
+    if not isinstance(info, dict) or info.get('key') != key:
+        return None
+    return info
+
+def _save_tool_info(info):
+    """Remember detection result in TOOL_CACHE_FILE.
+    """
+    if TOOL_CACHE_FILE:
+        _write_json(TOOL_CACHE_FILE, info)
+
+def _probe_unrar_tool():
+    """Run the tools to see which one works.
+    """
     try:
         # does UNRAR_TOOL work?
-        custom_check([ORIG_UNRAR_TOOL], True)
+        out = custom_check([ORIG_UNRAR_TOOL], True)
+        return {'tool': 'unrar', 'path': ORIG_UNRAR_TOOL, 'version': _tool_version(out),
+                'solid': True, 'password': True}
+    except RarCannotExec:
+        pass
+    try:
+        # does ALT_TOOL work?
+        out = custom_check([ALT_TOOL] + list(ALT_CHECK_ARGS), True)
+        return {'tool': 'alt', 'path': ALT_TOOL, 'version': _tool_version(out),
+                'solid': False, 'password': False}
+    except RarCannotExec:
+        # no usable tool, only uncompressed archives work
+        return {'tool': None, 'path': None, 'version': None,
+                'solid': False, 'password': False}
 
+def _check_unrar_tool():
+    global UNRAR_TOOL, OPEN_ARGS, EXTRACT_ARGS, TEST_ARGS, _tool_info
+
+    key = [os.environ.get('PATH', ''), _tool_stamp(ORIG_UNRAR_TOOL), _tool_stamp(ALT_TOOL)]
+    info = _load_tool_info(key)
+    if info is None:
+        info = _probe_unrar_tool()
+        info['key'] = key
+        _save_tool_info(info)
+    _tool_info = info
+
+    if info['tool'] == 'alt':
+        # replace config
+        UNRAR_TOOL = ALT_TOOL
+        OPEN_ARGS = ALT_OPEN_ARGS
+        EXTRACT_ARGS = ALT_EXTRACT_ARGS
+        TEST_ARGS = ALT_TEST_ARGS
+    else:
         UNRAR_TOOL = ORIG_UNRAR_TOOL
         OPEN_ARGS = ORIG_OPEN_ARGS
         EXTRACT_ARGS = ORIG_EXTRACT_ARGS
         TEST_ARGS = ORIG_TEST_ARGS
-    except RarCannotExec:
-        try:
-            # does ALT_TOOL work?
-            custom_check([ALT_TOOL] + list(ALT_CHECK_ARGS), True)
-            # replace config
-            UNRAR_TOOL = ALT_TOOL
-            OPEN_ARGS = ALT_OPEN_ARGS
-            EXTRACT_ARGS = ALT_EXTRACT_ARGS
-            TEST_ARGS = ALT_TEST_ARGS
-        except RarCannotExec:
-            # no usable tool, only uncompressed archives work
-            pass
 
-_check_unrar_tool()
+def _ensure_unrar_tool():
+    """Detect the tool on first use, taking settings changed after import into account.
+    """
+    global ORIG_UNRAR_TOOL, ORIG_OPEN_ARGS, ORIG_EXTRACT_ARGS, ORIG_TEST_ARGS
+    if _tool_info is not None:
+        return
+    ORIG_UNRAR_TOOL = UNRAR_TOOL
+    ORIG_OPEN_ARGS = OPEN_ARGS
+    ORIG_EXTRACT_ARGS = EXTRACT_ARGS
+    ORIG_TEST_ARGS = TEST_ARGS
+    _check_unrar_tool()
+
+def tool_info():
+    """Return details about the external tool used for decompression.
+
+    Keys are ``tool`` ('unrar', 'alt' or None), ``path``, ``version``
+    and the ``solid`` and ``password`` capabilities.
+    """
+    _ensure_unrar_tool()
+    info = dict(_tool_info)
+    info.pop('key', None)
+    return info
 
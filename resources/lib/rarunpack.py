@@ -0,0 +1,2131 @@
+# rarunpack.py
+#
+# Pure-Python RAR decompression.
+#
+# The algorithms follow the unrar source (unpack30.cpp, unpack50.cpp,
+# model.cpp, suballoc.cpp, rarvm.cpp), PPMd var.H by Dmitry Shkarin.
+#
+# This module is derived from the UnRAR source code, copyright
+# Alexander Roshal, and is distributed under the UnRAR license,
+# not under the GPL of the rest of this add-on:
+#
+#   UnRAR source code may be used in any software to handle
+#   RAR archives without limitations free of charge, but cannot be
+#   used to develop RAR (WinRAR) compatible archiver and to
+#   re-create RAR compression algorithm, which is proprietary.
+#   Distribution of modified UnRAR source code in separate form
+#   or as a part of other software is permitted, provided that
+#   full text of this paragraph, starting from "UnRAR source code"
+#   words, is included in license, or in documentation if license
+#   is not available, and in source code comments of resulting package.
+#
+
+r"""Pure-Python RAR decompression.
+
+Implements the RAR 2.9 method (LZ, PPMd and the standard RarVM filters)
+and the RAR 5.0 method, enough to read RAR3 and RAR5 archives created by
+RAR 3.x and later without the unrar tool.
+
+Usage::
+
+    unp = rarunpack.new_unpacker(29, 0x400000)
+    unp.begin(read, file_size, compress_size, solid=False)
+    data = unp.read(file_size)
+
+Members of a solid archive are decompressed by the same unpacker,
+in archive order.
+"""
+
+from __future__ import division, print_function
+
+import re
+import struct
+from binascii import crc32
+
+__all__ = ['UnpackError', 'SUPPORTED_VERSIONS', 'new_unpacker']
+
+#: unpack versions handled here
+SUPPORTED_VERSIONS = (29, 50)
+
+
+class UnpackError(Exception):
+    """Corrupt or unsupported compressed data."""
+
+
+def new_unpacker(version, winsize):
+    """Return unpacker for unpack version, None if not supported."""
+    if version == 29:
+        return Unpack29(winsize)
+    if version == 50:
+        return Unpack50(winsize)
+    return None
+
+
+##
+## Input and Huffman decoding
+##
+
+_CHUNK = 0x10000
+_PAD = bytes(bytearray(16))
+
+_S_LONG = struct.Struct('<L')
+
+
+class _BitInput(object):
+    """Bit reader over packed data, read in chunks from read(n).
+
+    Hot loops access buf and pos directly.  Reading is safe
+    while pos is below border.
+    """
+
+    def __init__(self, read=None, size=0, data=b''):
+        self._read = read
+        self.left = size
+        self.buf = bytearray(data)
+        self.end = len(data)
+        self.base = 0
+        self.pos = 0
+        self.border = 0
+        self.fill()
+
+    def fill(self, need=_CHUNK):
+        """Drop consumed bytes and read more data."""
+        buf = self.buf
+        ofs = self.pos >> 3
+        if ofs:
+            del buf[:ofs]
+            self.base += ofs
+            self.end -= ofs
+            self.pos &= 7
+        del buf[self.end:]
+        while self.left > 0 and self.end < need:
+            data = self._read(min(self.left, max(need - self.end, _CHUNK)))
+            if not data:
+                self.left = 0
+                break
+            buf += data
+            self.end += len(data)
+            self.left -= len(data)
+        buf += _PAD
+        if self.left:
+            self.border = (self.end - 32) << 3
+        else:
+            self.border = (self.end + 1) << 3
+
+    def ensure(self, count):
+        """Make sure count bytes are buffered, if available."""
+        if self.left and self.end - (self.pos >> 3) < count + 32:
+            self.fill(count + 32)
+
+    def overrun(self):
+        """Return True if reading went past the end of data."""
+        return not self.left and (self.pos >> 3) > self.end
+
+    def getbits(self):
+        """Return next 16 bits."""
+        pos = self.pos
+        buf = self.buf
+        i = pos >> 3
+        return ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (8 - (pos & 7))) & 0xffff
+
+    def addbits(self, count):
+        """Skip count bits."""
+        self.pos += count
+
+    def align(self):
+        """Skip to byte boundary."""
+        self.pos = (self.pos + 7) & ~7
+
+    def getbyte(self):
+        """Read byte from byte-aligned position, zero after end of data."""
+        i = self.pos >> 3
+        if i + 4 >= self.end and self.left:
+            self.fill()
+            i = self.pos >> 3
+        self.pos += 8
+        if i < self.end:
+            return self.buf[i]
+        return 0
+
+
+def _decode_table(lengths):
+    """Build Huffman decode table from code lengths.
+
+    The table is indexed by the next 15 bits of input,
+    entries are symbol << 4 | code length.
+    """
+    table = [15] * 0x8000
+    pos = 0
+    for n, sym in sorted((n, sym) for sym, n in enumerate(lengths) if n):
+        step = 1 << (15 - n)
+        if pos + step > 0x8000:
+            break
+        table[pos : pos + step] = [sym << 4 | n] * step
+        pos += step
+    return table
+
+
+def _decode_number(inp, table):
+    """Decode one symbol outside of hot loops."""
+    ent = table[inp.getbits() >> 1]
+    inp.pos += ent & 15
+    return ent >> 4
+
+
+def _read_bitlengths(inp):
+    """Read code lengths for the 20-symbol table coding other tables."""
+    lens = []
+    while len(lens) < 20:
+        n = inp.getbits() >> 12
+        inp.addbits(4)
+        if n == 15:
+            zeros = inp.getbits() >> 12
+            inp.addbits(4)
+            if zeros == 0:
+                lens.append(15)
+            else:
+                lens.extend([0] * min(zeros + 2, 20 - len(lens)))
+        else:
+            lens.append(n)
+    return lens
+
+
+def _read_lengths(inp, size, old=None):
+    """Read code lengths of main tables, None on error."""
+    bd = _decode_table(_read_bitlengths(inp))
+    table = []
+    while len(table) < size:
+        num = _decode_number(inp, bd)
+        if num < 16:
+            if old:
+                num = (num + old[len(table)]) & 15
+            table.append(num)
+            continue
+        if num & 1:
+            cnt = (inp.getbits() >> 9) + 11
+            inp.addbits(7)
+        else:
+            cnt = (inp.getbits() >> 13) + 3
+            inp.addbits(3)
+        cnt = min(cnt, size - len(table))
+        if num < 18:
+            if not table:
+                return None
+            table.extend([table[-1]] * cnt)
+        else:
+            table.extend([0] * cnt)
+    return table
+
+
+def _copy(win, length, dist):
+    """Append match of length bytes from dist bytes back."""
+    start = len(win) - dist
+    if start < 0 or dist <= 0:
+        raise UnpackError('Match distance outside of window')
+    if dist >= length:
+        win.extend(win[start : start + length])
+    else:
+        win.extend((win[start:] * (length // dist + 1))[:length])
+
+
+##
+## Filters
+##
+
+_E8 = re.compile(b'\xe8')
+_E8E9 = re.compile(b'[\xe8\xe9]')
+
+
+def _filter_e8(data, size, file_offset, e9, rar5):
+    """x86 CALL/JMP address conversion, in place."""
+    find = (_E8E9 if e9 else _E8).search
+    pos = 0
+    while 1:
+        m = find(data, pos, size - 4)
+        if not m:
+            break
+        cur = m.start() + 1
+        if rar5:
+            offset = (cur + file_offset) % 0x1000000
+        else:
+            offset = (cur + file_offset) & 0xffffffff
+        addr = _S_LONG.unpack_from(data, cur)[0]
+        if addr & 0x80000000:
+            if not (addr + offset) & 0x80000000:
+                _S_LONG.pack_into(data, cur, (addr + 0x1000000) & 0xffffffff)
+        elif (addr - 0x1000000) & 0x80000000:
+            _S_LONG.pack_into(data, cur, (addr - offset) & 0xffffffff)
+        pos = cur + 4
+
+
+def _filter_arm(data, size, file_offset):
+    """ARM BL address conversion, in place."""
+    for pos in range(0, size - 3, 4):
+        if data[pos + 3] == 0xeb:
+            ofs = data[pos] | data[pos + 1] << 8 | data[pos + 2] << 16
+            ofs = (ofs - ((file_offset + pos) & 0xffffffff) // 4) & 0xffffff
+            data[pos] = ofs & 0xff
+            data[pos + 1] = (ofs >> 8) & 0xff
+            data[pos + 2] = ofs >> 16
+
+
+def _filter_delta(src, size, channels):
+    """Interleave and integrate channel deltas."""
+    dst = bytearray(size)
+    pos = 0
+    for chan in range(channels):
+        prev = 0
+        for i in range(chan, size, channels):
+            prev = (prev - src[pos]) & 0xff
+            dst[i] = prev
+            pos += 1
+    return dst
+
+
+_ITANIUM_MASKS = (4, 4, 6, 6, 0, 0, 7, 7, 4, 4, 0, 0, 4, 4, 0, 0)
+
+
+def _itanium_get(data, bitpos, count):
+    i = bitpos >> 3
+    val = data[i] | data[i + 1] << 8 | data[i + 2] << 16 | data[i + 3] << 24
+    return (val >> (bitpos & 7)) & ((1 << count) - 1)
+
+
+def _itanium_set(data, val, bitpos, count):
+    i = bitpos >> 3
+    bit = bitpos & 7
+    mask = ~(((1 << count) - 1) << bit) & 0xffffffff
+    val <<= bit
+    for j in range(4):
+        data[i + j] = (data[i + j] & mask & 0xff) | (val & 0xff)
+        mask = (mask >> 8) | 0xff000000
+        val >>= 8
+
+
+def _filter_itanium(data, size, file_offset):
+    """IA-64 branch address conversion, in place."""
+    pos = 0
+    file_offset >>= 4
+    while pos < size - 21:
+        b = (data[pos] & 0x1f) - 0x10
+        if b >= 0:
+            cmd_mask = _ITANIUM_MASKS[b]
+            for i in range(3):
+                if cmd_mask & (1 << i):
+                    start = (pos << 3) + i * 41 + 5
+                    if _itanium_get(data, start + 37, 4) == 5:
+                        ofs = _itanium_get(data, start + 13, 20)
+                        _itanium_set(data, (ofs - file_offset) & 0xfffff, start + 13, 20)
+        pos += 16
+        file_offset += 1
+
+
+def _filter_rgb(src, size, width, pos_r):
+    """Predictive decoding of 24-bit image data."""
+    dst = bytearray(size)
+    pos = 0
+    for chan in range(3):
+        prev = 0
+        for i in range(chan, size, 3):
+            if i >= width + 3:
+                upper = dst[i - width]
+                upper_left = dst[i - width - 3]
+                pred = prev + upper - upper_left
+                pa = abs(pred - prev)
+                pb = abs(pred - upper)
+                pc = abs(pred - upper_left)
+                if pa <= pb and pa <= pc:
+                    pred = prev
+                elif pb <= pc:
+                    pred = upper
+                else:
+                    pred = upper_left
+            else:
+                pred = prev
+            prev = (pred - src[pos]) & 0xff
+            dst[i] = prev
+            pos += 1
+    for i in range(pos_r, size - 2, 3):
+        g = dst[i + 1]
+        dst[i] = (dst[i] + g) & 0xff
+        dst[i + 2] = (dst[i + 2] + g) & 0xff
+    return dst
+
+
+def _signed_byte(v):
+    v &= 0xff
+    return v - 0x100 if v & 0x80 else v
+
+
+def _filter_audio(src, size, channels):
+    """Adaptive predictive decoding of audio samples."""
+    dst = bytearray(size)
+    pos = 0
+    for chan in range(channels):
+        prev_byte = prev_delta = 0
+        dif = [0] * 7
+        d1 = d2 = d3 = 0
+        k1 = k2 = k3 = 0
+        count = 0
+        for i in range(chan, size, channels):
+            d3 = d2
+            d2 = prev_delta - d1
+            d1 = prev_delta
+
+            pred = ((8 * prev_byte + k1 * d1 + k2 * d2 + k3 * d3) >> 3) & 0xff
+            cur = src[pos]
+            pos += 1
+            pred = (pred - cur) & 0xff
+            dst[i] = pred
+            prev_delta = _signed_byte(pred - prev_byte)
+            prev_byte = pred
+
+            d = _signed_byte(cur) << 3
+            dif[0] += abs(d)
+            dif[1] += abs(d - d1)
+            dif[2] += abs(d + d1)
+            dif[3] += abs(d - d2)
+            dif[4] += abs(d + d2)
+            dif[5] += abs(d - d3)
+            dif[6] += abs(d + d3)
+
+            if (count & 0x1f) == 0:
+                min_dif = dif[0]
+                num = 0
+                dif[0] = 0
+                for j in range(1, 7):
+                    if dif[j] < min_dif:
+                        min_dif = dif[j]
+                        num = j
+                    dif[j] = 0
+                if num == 1:
+                    if k1 >= -16:
+                        k1 -= 1
+                elif num == 2:
+                    if k1 < 16:
+                        k1 += 1
+                elif num == 3:
+                    if k2 >= -16:
+                        k2 -= 1
+                elif num == 4:
+                    if k2 < 16:
+                        k2 += 1
+                elif num == 5:
+                    if k3 >= -16:
+                        k3 -= 1
+                elif num == 6:
+                    if k3 < 16:
+                        k3 += 1
+            count += 1
+    return dst
+
+
+##
+## Common unpacker
+##
+
+class _Unpack(object):
+    """Window and output handling shared by the methods.
+
+    The window is a growing buffer addressed by absolute
+    positions; old data is dropped once written and farther
+    back than the dictionary size.
+    """
+
+    def __init__(self, winsize):
+        self._keep = max(winsize, 0x40000)
+        self._win = bytearray()
+        self._base = 0
+        self._wrpos = 0
+        self._inp = None
+        self._out = bytearray()
+        self._size = 0
+        self._written = 0
+        self._done = True
+
+    def begin(self, read, size, packed, solid=False):
+        """Start decompressing a file from packed bytes returned by read(n).
+
+        Solid files continue from the state left by the previous one.
+        """
+        if not solid or self._inp is None:
+            self._win = bytearray()
+            self._base = 0
+            solid = False
+        self._wrpos = self._base + len(self._win)
+        self._inp = _BitInput(read, packed)
+        self._size = size
+        self._written = 0
+        self._out = bytearray()
+        self._done = False
+        try:
+            self._start(solid)
+        except (IndexError, ValueError, ZeroDivisionError):
+            raise UnpackError('Corrupt compressed data')
+
+    def read(self, cnt):
+        """Return up to cnt bytes of file data, empty at end of file."""
+        out = self._out
+        while len(out) < cnt and not self._done:
+            self._run(cnt - len(out))
+        data = bytes(out[:cnt])
+        del out[:cnt]
+        return data
+
+    def skip(self):
+        """Decompress and drop rest of the file."""
+        while not self._done:
+            self._run(_CHUNK * 16)
+            del self._out[:]
+
+    def _run(self, cnt):
+        win = self._win
+        start = self._base + len(win)
+        try:
+            self._decode(len(win) + max(cnt, _CHUNK))
+        except (IndexError, ValueError, ZeroDivisionError):
+            if self._base + len(win) - self._wrpos + self._written < self._size:
+                raise UnpackError('Corrupt compressed data')
+            self._done = True
+        except UnpackError:
+            # garbage after the end of data is ignored, as unrar does
+            if self._base + len(win) - self._wrpos + self._written < self._size:
+                raise
+            self._done = True
+        self._flush()
+        if not self._done and self._base + len(win) == start and not self._out:
+            raise UnpackError('No progress in decompression')
+
+    def _write(self, data):
+        left = self._size - self._written
+        if left > 0:
+            self._out += data[:left] if len(data) > left else data
+        self._written += len(data)
+
+    def _trim(self):
+        excess = len(self._win) - self._keep
+        if excess > self._keep:
+            cut = min(excess, self._wrpos - self._base)
+            if cut > 0:
+                del self._win[:cut]
+                self._base += cut
+
+    def _start(self, solid):
+        raise NotImplementedError('_start')
+
+    def _decode(self, olim):
+        raise NotImplementedError('_decode')
+
+    def _flush(self):
+        raise NotImplementedError('_flush')
+
+
+##
+## RAR 5.0
+##
+
+# length and distance slots
+_LEN5_BASE = [2 + s if s < 8 else 2 + ((4 | (s & 3)) << (s // 4 - 1)) for s in range(44)]
+_LEN5_BITS = [0 if s < 8 else s // 4 - 1 for s in range(44)]
+_DIST5_BASE = [1 + s if s < 4 else 1 + ((2 | (s & 1)) << (s // 2 - 1)) for s in range(64)]
+_DIST5_BITS = [0 if s < 4 else s // 2 - 1 for s in range(64)]
+
+_FILTER_DELTA = 0
+_FILTER_E8 = 1
+_FILTER_E8E9 = 2
+_FILTER_ARM = 3
+
+_MAX_FILTERS = 8192
+_MAX_FILTER_BLOCK = 0x400000
+
+
+class Unpack50(_Unpack):
+    """RAR 5.0 decompression."""
+
+    def __init__(self, winsize):
+        super(Unpack50, self).__init__(winsize)
+        self._tables = None
+        self._olddist = [0, 0, 0, 0]
+        self._lastlen = 0
+        self._filters = []
+        self._block_end = 0
+        self._last_block = True
+
+    def _start(self, solid):
+        if not solid:
+            self._tables = None
+            self._olddist = [0, 0, 0, 0]
+            self._lastlen = 0
+        self._filters = []
+        self._read_block()
+
+    def _read_block(self):
+        inp = self._inp
+        inp.ensure(0x1000)
+        inp.align()
+        flags = inp.getbits() >> 8
+        inp.addbits(8)
+        nbytes = ((flags >> 3) & 3) + 1
+        if nbytes == 4:
+            raise UnpackError('Bad block header')
+        chk = inp.getbits() >> 8
+        inp.addbits(8)
+        size = 0
+        for i in range(nbytes):
+            size += (inp.getbits() >> 8) << (i * 8)
+            inp.addbits(8)
+        if chk != (0x5a ^ flags ^ size ^ (size >> 8) ^ (size >> 16)) & 0xff:
+            raise UnpackError('Bad block header checksum')
+        start = inp.base + (inp.pos >> 3)
+        self._block_end = ((start + size - 1) << 3) + (flags & 7) + 1
+        self._last_block = flags & 0x40
+        if flags & 0x80:
+            lens = _read_lengths(inp, 430)
+            if lens is None or inp.overrun():
+                raise UnpackError('Bad Huffman tables')
+            self._tables = (_decode_table(lens[:306]), _decode_table(lens[306:370]),
+                            _decode_table(lens[370:386]), _decode_table(lens[386:]))
+        if self._tables is None:
+            raise UnpackError('Missing Huffman tables')
+
+    def _read_filter_data(self):
+        inp = self._inp
+        cnt = (inp.getbits() >> 14) + 1
+        inp.addbits(2)
+        val = 0
+        for i in range(cnt):
+            val += (inp.getbits() >> 8) << (i * 8)
+            inp.addbits(8)
+        return val
+
+    def _read_filter(self):
+        inp = self._inp
+        start = self._read_filter_data()
+        length = self._read_filter_data()
+        if length > _MAX_FILTER_BLOCK:
+            length = 0
+        ftype = inp.getbits() >> 13
+        inp.addbits(3)
+        channels = 0
+        if ftype == _FILTER_DELTA:
+            channels = (inp.getbits() >> 11) + 1
+            inp.addbits(5)
+        if len(self._filters) >= _MAX_FILTERS:
+            self._flush()
+            if len(self._filters) >= _MAX_FILTERS:
+                self._filters = []
+        self._filters.append((self._base + len(self._win) + start, length, ftype, channels))
+
+    def _decode(self, olim):
+        inp = self._inp
+        buf = inp.buf
+        bp = inp.pos
+        win = self._win
+        append = win.append
+        ld, dd, ldd, rd = self._tables
+        olddist = self._olddist
+        lastlen = self._lastlen
+        bend = self._block_end - (inp.base << 3)
+        lim = min(inp.border, bend)
+        while 1:
+            if bp >= lim:
+                inp.pos = bp
+                if bp >= bend:
+                    if self._last_block:
+                        self._done = True
+                        break
+                    self._read_block()
+                    ld, dd, ldd, rd = self._tables
+                elif bp >= inp.border:
+                    if not inp.left:
+                        raise UnpackError('Unexpected end of data')
+                    inp.fill()
+                buf = inp.buf
+                bp = inp.pos
+                bend = self._block_end - (inp.base << 3)
+                lim = min(inp.border, bend)
+                if len(win) >= olim:
+                    break
+                continue
+
+            i = bp >> 3
+            ent = ld[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+            bp += ent & 15
+            slot = ent >> 4
+            if slot < 256:
+                append(slot)
+                continue
+
+            if slot >= 262:
+                slot -= 262
+                length = _LEN5_BASE[slot]
+                bits = _LEN5_BITS[slot]
+                if bits:
+                    i = bp >> 3
+                    length += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                    bp += bits
+
+                i = bp >> 3
+                ent = dd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+                bp += ent & 15
+                slot = ent >> 4
+                dist = _DIST5_BASE[slot]
+                bits = _DIST5_BITS[slot]
+                if bits >= 4:
+                    if bits > 4:
+                        bits -= 4
+                        i = bp >> 3
+                        dist += (((buf[i] << 32 | buf[i + 1] << 24 | buf[i + 2] << 16 | buf[i + 3] << 8 | buf[i + 4])
+                                  >> (40 - (bp & 7) - bits)) & ((1 << bits) - 1)) << 4
+                        bp += bits
+                    i = bp >> 3
+                    ent = ldd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+                    bp += ent & 15
+                    dist += ent >> 4
+                elif bits:
+                    i = bp >> 3
+                    dist += ((buf[i] << 8 | buf[i + 1]) >> (16 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                    bp += bits
+
+                if dist > 0x100:
+                    length += 1
+                    if dist > 0x2000:
+                        length += 1
+                        if dist > 0x40000:
+                            length += 1
+
+                olddist.insert(0, dist)
+                del olddist[4]
+                lastlen = length
+                _copy(win, length, dist)
+                if len(win) >= olim:
+                    lim = 0
+                continue
+
+            if slot == 256:
+                inp.pos = bp
+                self._read_filter()
+                bp = inp.pos
+                continue
+
+            if slot == 257:
+                if lastlen:
+                    _copy(win, lastlen, olddist[0])
+                    if len(win) >= olim:
+                        lim = 0
+                continue
+
+            dist = olddist.pop(slot - 258)
+            olddist.insert(0, dist)
+
+            i = bp >> 3
+            ent = rd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+            bp += ent & 15
+            slot = ent >> 4
+            length = _LEN5_BASE[slot]
+            bits = _LEN5_BITS[slot]
+            if bits:
+                i = bp >> 3
+                length += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                bp += bits
+            lastlen = length
+            _copy(win, length, dist)
+            if len(win) >= olim:
+                lim = 0
+
+        inp.pos = bp
+        self._lastlen = lastlen
+
+    def _flush(self):
+        win = self._win
+        base = self._base
+        end = base + len(win)
+        wr = self._wrpos
+        pending = []
+        blocked = False
+        for flt in self._filters:
+            start, length, ftype, channels = flt
+            if blocked or not wr <= start < end:
+                pending.append(flt)
+                continue
+            if start != wr:
+                self._write(win[wr - base : start - base])
+                wr = start
+            if length > end - start:
+                pending.append(flt)
+                blocked = True
+            elif length > 0:
+                data = win[start - base : start - base + length]
+                if ftype in (_FILTER_E8, _FILTER_E8E9):
+                    _filter_e8(data, length, self._written, ftype == _FILTER_E8E9, True)
+                elif ftype == _FILTER_ARM:
+                    _filter_arm(data, length, self._written)
+                elif ftype == _FILTER_DELTA:
+                    data = _filter_delta(data, length, channels)
+                else:
+                    raise UnpackError('Unsupported filter')
+                self._write(data)
+                wr = start + length
+        self._filters = pending
+        if not blocked:
+            self._write(win[wr - base :])
+            wr = end
+        self._wrpos = wr
+        self._trim()
+
+
+##
+## RAR 2.9
+##
+
+_LDECODE = (0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 16, 20, 24, 28, 32, 40, 48, 56, 64,
+            80, 96, 112, 128, 160, 192, 224)
+_LBITS = (0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5)
+_SDDECODE = (0, 4, 8, 16, 32, 64, 128, 192)
+_SDBITS = (2, 2, 3, 4, 5, 6, 6, 6)
+
+
+def _make_dist30():
+    base, bits = [], []
+    dist = 0
+    for nbits, cnt in enumerate((4, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 14, 0, 12)):
+        for _ in range(cnt):
+            base.append(dist)
+            bits.append(nbits)
+            dist += 1 << nbits
+    return base, bits
+
+_DDECODE, _DBITS = _make_dist30()
+
+_NC30 = 299
+_DC30 = 60
+_LDC30 = 17
+_RC30 = 28
+_TABLE_SIZE30 = _NC30 + _DC30 + _LDC30 + _RC30
+
+_VM_MEMSIZE = 0x40000
+_MAX3_FILTERS = 8192
+
+# standard RarVM filters, recognized by code length and crc
+_VMSF_E8, _VMSF_E8E9, _VMSF_ITANIUM, _VMSF_DELTA, _VMSF_RGB, _VMSF_AUDIO = range(1, 7)
+_VM_STANDARD = {
+    (53, 0xad576887): _VMSF_E8,
+    (57, 0x3cd7e57e): _VMSF_E8E9,
+    (120, 0x3769893f): _VMSF_ITANIUM,
+    (29, 0x0e06077d): _VMSF_DELTA,
+    (149, 0x1c2c5dc8): _VMSF_RGB,
+    (216, 0xbc85e701): _VMSF_AUDIO,
+}
+
+
+def _vm_filter_type(code):
+    """Identify standard filter from its VM code, None if unknown."""
+    xor = 0
+    for b in code[1:]:
+        xor ^= b
+    if xor != code[0]:
+        return None
+    return _VM_STANDARD.get((len(code), crc32(bytes(code)) & 0xffffffff))
+
+
+def _vm_read_data(inp):
+    """Read variable-length number from filter data."""
+    data = inp.getbits()
+    kind = data & 0xc000
+    if kind == 0:
+        inp.addbits(6)
+        return (data >> 10) & 0xf
+    if kind == 0x4000:
+        if (data & 0x3c00) == 0:
+            inp.addbits(14)
+            return 0xffffff00 | ((data >> 2) & 0xff)
+        inp.addbits(10)
+        return (data >> 6) & 0xff
+    inp.addbits(2)
+    if kind == 0x8000:
+        data = inp.getbits()
+        inp.addbits(16)
+        return data
+    data = inp.getbits() << 16
+    inp.addbits(16)
+    data |= inp.getbits()
+    inp.addbits(16)
+    return data
+
+
+class Unpack29(_Unpack):
+    """RAR 2.9 (RAR 3.x) decompression."""
+
+    def __init__(self, winsize):
+        super(Unpack29, self).__init__(winsize)
+        self._tables = None
+        self._old_table = [0] * _TABLE_SIZE30
+        self._olddist = [0, 0, 0, 0]
+        self._lastlen = 0
+        self._prev_low = 0
+        self._low_rep = 0
+        self._tables_read = False
+        self._ppm_block = False
+        self._ppm = None
+        self._esc_char = 2
+        self._vm_filters = []
+        self._old_lengths = []
+        self._last_filter = 0
+        self._stack = []
+
+    def _start(self, solid):
+        if not solid:
+            self._tables = None
+            self._old_table = [0] * _TABLE_SIZE30
+            self._olddist = [0, 0, 0, 0]
+            self._lastlen = 0
+            self._tables_read = False
+            self._ppm_block = False
+            self._esc_char = 2
+            self._vm_filters = []
+            self._old_lengths = []
+            self._last_filter = 0
+        self._stack = []
+        if self._ppm:
+            self._ppm.getc = self._inp.getbyte
+        if (not solid or not self._tables_read) and not self._read_tables():
+            self._done = True
+
+    def _read_tables(self):
+        inp = self._inp
+        inp.ensure(0x1000)
+        inp.align()
+        bits = inp.getbits()
+        if bits & 0x8000:
+            self._ppm_block = True
+            if self._ppm is None:
+                self._ppm = _ModelPPM()
+            ok, self._esc_char = self._ppm.decode_init(inp.getbyte, self._esc_char)
+            return ok
+        self._ppm_block = False
+        self._prev_low = 0
+        self._low_rep = 0
+        if not bits & 0x4000:
+            self._old_table = [0] * _TABLE_SIZE30
+        inp.addbits(2)
+        lens = _read_lengths(inp, _TABLE_SIZE30, self._old_table)
+        if lens is None:
+            return False
+        self._tables_read = True
+        if inp.overrun():
+            return False
+        self._tables = (_decode_table(lens[:_NC30]),
+                        _decode_table(lens[_NC30 : _NC30 + _DC30]),
+                        _decode_table(lens[_NC30 + _DC30 : _NC30 + _DC30 + _LDC30]),
+                        _decode_table(lens[_NC30 + _DC30 + _LDC30:]))
+        self._old_table = lens
+        return True
+
+    def _read_end_of_block(self):
+        inp = self._inp
+        bits = inp.getbits()
+        if bits & 0x8000:
+            new_table, new_file = True, False
+            inp.addbits(1)
+        else:
+            new_table, new_file = (bits & 0x4000) != 0, True
+            inp.addbits(2)
+        self._tables_read = not new_table
+        if new_file:
+            return False
+        return self._read_tables()
+
+    def _decode(self, olim):
+        while not self._done and len(self._win) < olim:
+            if self._ppm_block:
+                self._decode_ppm(olim)
+            else:
+                self._decode_lz(olim)
+
+    def _decode_lz(self, olim):
+        inp = self._inp
+        buf = inp.buf
+        bp = inp.pos
+        lim = inp.border
+        win = self._win
+        append = win.append
+        ld, dd, ldd, rd = self._tables
+        olddist = self._olddist
+        lastlen = self._lastlen
+        prev_low = self._prev_low
+        low_rep = self._low_rep
+        while 1:
+            if bp >= lim:
+                if bp >= inp.border:
+                    if not inp.left:
+                        self._done = True
+                        break
+                    inp.pos = bp
+                    inp.fill()
+                    buf = inp.buf
+                    bp = inp.pos
+                lim = inp.border
+                if len(win) >= olim:
+                    break
+                continue
+
+            i = bp >> 3
+            ent = ld[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+            bp += ent & 15
+            num = ent >> 4
+            if num < 256:
+                append(num)
+                continue
+
+            if num >= 271:
+                num -= 271
+                length = _LDECODE[num] + 3
+                bits = _LBITS[num]
+                if bits:
+                    i = bp >> 3
+                    length += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                    bp += bits
+
+                i = bp >> 3
+                ent = dd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+                bp += ent & 15
+                num = ent >> 4
+                dist = _DDECODE[num] + 1
+                bits = _DBITS[num]
+                if bits:
+                    if num > 9:
+                        if bits > 4:
+                            bits -= 4
+                            i = bp >> 3
+                            dist += (((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits))
+                                     & ((1 << bits) - 1)) << 4
+                            bp += bits
+                        if low_rep > 0:
+                            low_rep -= 1
+                            dist += prev_low
+                        else:
+                            i = bp >> 3
+                            ent = ldd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+                            bp += ent & 15
+                            low = ent >> 4
+                            if low == 16:
+                                low_rep = 15
+                                dist += prev_low
+                            else:
+                                dist += low
+                                prev_low = low
+                    else:
+                        i = bp >> 3
+                        dist += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                        bp += bits
+
+                if dist >= 0x2000:
+                    length += 1
+                    if dist >= 0x40000:
+                        length += 1
+
+                olddist.insert(0, dist)
+                del olddist[4]
+                lastlen = length
+                _copy(win, length, dist)
+                if len(win) >= olim:
+                    lim = 0
+                continue
+
+            if num == 256 or num == 257:
+                inp.pos = bp
+                self._lastlen = lastlen
+                self._prev_low = prev_low
+                self._low_rep = low_rep
+                if num == 256:
+                    ok = self._read_end_of_block()
+                else:
+                    ok = self._read_vm_code()
+                if not ok:
+                    self._done = True
+                    return
+                if self._ppm_block:
+                    return
+                buf = inp.buf
+                bp = inp.pos
+                lim = 0
+                ld, dd, ldd, rd = self._tables
+                prev_low = self._prev_low
+                low_rep = self._low_rep
+                continue
+
+            if num == 258:
+                if lastlen:
+                    _copy(win, lastlen, olddist[0])
+                    if len(win) >= olim:
+                        lim = 0
+                continue
+
+            if num < 263:
+                dist = olddist.pop(num - 259)
+                olddist.insert(0, dist)
+
+                i = bp >> 3
+                ent = rd[((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (9 - (bp & 7))) & 0x7fff]
+                bp += ent & 15
+                num = ent >> 4
+                length = _LDECODE[num] + 2
+                bits = _LBITS[num]
+                if bits:
+                    i = bp >> 3
+                    length += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+                    bp += bits
+                lastlen = length
+                _copy(win, length, dist)
+                if len(win) >= olim:
+                    lim = 0
+                continue
+
+            num -= 263
+            dist = _SDDECODE[num] + 1
+            bits = _SDBITS[num]
+            i = bp >> 3
+            dist += ((buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]) >> (24 - (bp & 7) - bits)) & ((1 << bits) - 1)
+            bp += bits
+            olddist.insert(0, dist)
+            del olddist[4]
+            lastlen = 2
+            _copy(win, 2, dist)
+
+        inp.pos = bp
+        self._lastlen = lastlen
+        self._prev_low = prev_low
+        self._low_rep = low_rep
+
+    def _ppm_char(self):
+        ch = self._ppm.decode_char()
+        if ch < 0:
+            self._ppm.cleanup()
+            self._ppm_block = False
+            self._done = True
+        return ch
+
+    def _decode_ppm(self, olim):
+        inp = self._inp
+        win = self._win
+        append = win.append
+        decode = self._ppm_char
+        while len(win) < olim:
+            if inp.pos >= inp.border:
+                if not inp.left:
+                    self._done = True
+                    return
+                inp.fill()
+            ch = decode()
+            if ch < 0:
+                return
+            if ch != self._esc_char:
+                append(ch)
+                continue
+            ch = decode()
+            if ch < 0:
+                return
+            if ch == 0:
+                if not self._read_tables():
+                    self._done = True
+                    return
+                if not self._ppm_block:
+                    return
+            elif ch == 2:
+                self._done = True
+                return
+            elif ch == 3:
+                if not self._read_vm_code_ppm():
+                    self._done = True
+                    return
+            elif ch == 4:
+                dist = 0
+                for _ in range(3):
+                    ch = decode()
+                    if ch < 0:
+                        return
+                    dist = (dist << 8) + ch
+                ch = decode()
+                if ch < 0:
+                    return
+                _copy(win, ch + 32, dist + 2)
+            elif ch == 5:
+                ch = decode()
+                if ch < 0:
+                    return
+                _copy(win, ch + 4, 1)
+            else:
+                append(self._esc_char)
+
+    def _read_vm_code(self):
+        inp = self._inp
+        first = inp.getbits() >> 8
+        inp.addbits(8)
+        length = (first & 7) + 1
+        if length == 7:
+            length = (inp.getbits() >> 8) + 7
+            inp.addbits(8)
+        elif length == 8:
+            length = inp.getbits()
+            inp.addbits(16)
+        if length == 0:
+            return False
+        inp.ensure(length)
+        code = bytearray(length)
+        for i in range(length):
+            code[i] = inp.getbits() >> 8
+            inp.addbits(8)
+        return self._add_vm_code(first, code)
+
+    def _read_vm_code_ppm(self):
+        decode = self._ppm_char
+        first = decode()
+        if first < 0:
+            return False
+        length = (first & 7) + 1
+        if length == 7:
+            b1 = decode()
+            if b1 < 0:
+                return False
+            length = b1 + 7
+        elif length == 8:
+            b1 = decode()
+            if b1 < 0:
+                return False
+            b2 = decode()
+            if b2 < 0:
+                return False
+            length = b1 * 256 + b2
+        if length == 0:
+            return False
+        code = bytearray(length)
+        for i in range(length):
+            ch = decode()
+            if ch < 0:
+                return False
+            code[i] = ch
+        return self._add_vm_code(first, code)
+
+    def _add_vm_code(self, first, code):
+        inp = _BitInput(data=code)
+        if first & 0x80:
+            pos = _vm_read_data(inp)
+            if pos == 0:
+                self._vm_filters = []
+                self._old_lengths = []
+                self._last_filter = 0
+                self._stack = []
+            else:
+                pos -= 1
+        else:
+            pos = self._last_filter
+        if pos > len(self._vm_filters) or pos > len(self._old_lengths):
+            return False
+        self._last_filter = pos
+        new_filter = pos == len(self._vm_filters)
+        if new_filter:
+            if pos > _MAX3_FILTERS:
+                return False
+            self._vm_filters.append(None)
+            self._old_lengths.append(0)
+        if len(self._stack) > _MAX3_FILTERS:
+            return False
+
+        start = _vm_read_data(inp)
+        if first & 0x40:
+            start += 258
+        start = self._base + len(self._win) + (start & 0xffffffff)
+        if first & 0x20:
+            length = _vm_read_data(inp)
+            self._old_lengths[pos] = length
+        else:
+            length = self._old_lengths[pos]
+
+        regs = [0] * 7
+        regs[4] = length
+        if first & 0x10:
+            mask = inp.getbits() >> 9
+            inp.addbits(7)
+            for i in range(7):
+                if mask & (1 << i):
+                    regs[i] = _vm_read_data(inp)
+
+        if new_filter:
+            size = _vm_read_data(inp)
+            if size >= 0x10000 or size == 0 or (inp.pos >> 3) + size > len(code):
+                return False
+            vmcode = bytearray(size)
+            for i in range(size):
+                vmcode[i] = inp.getbits() >> 8
+                inp.addbits(8)
+            self._vm_filters[pos] = _vm_filter_type(vmcode)
+
+        self._stack.append((start, length, self._vm_filters[pos], regs))
+        return True
+
+    def _execute(self, flt, data):
+        ftype, regs = flt[2], list(flt[3])
+        regs[6] = self._written & 0xffffffff
+        size = regs[4]
+        mem = bytearray(data[:_VM_MEMSIZE])
+        out_size = size & (_VM_MEMSIZE - 1)
+        if ftype in (_VMSF_E8, _VMSF_E8E9):
+            if 4 <= size <= _VM_MEMSIZE:
+                _filter_e8(mem, size, regs[6], ftype == _VMSF_E8E9, False)
+        elif ftype == _VMSF_ITANIUM:
+            if 21 <= size <= _VM_MEMSIZE:
+                _filter_itanium(mem, size, regs[6])
+        elif ftype == _VMSF_DELTA:
+            if size <= _VM_MEMSIZE // 2 and 0 < regs[0] <= 1024:
+                return _filter_delta(mem, size, regs[0])
+        elif ftype == _VMSF_RGB:
+            width = (regs[0] - 3) & 0xffffffff
+            if 3 <= size <= _VM_MEMSIZE // 2 and width <= size and regs[1] <= 2:
+                return _filter_rgb(mem, size, width, regs[1])
+        elif ftype == _VMSF_AUDIO:
+            if size <= _VM_MEMSIZE // 2 and 0 < regs[0] <= 128:
+                return _filter_audio(mem, size, regs[0])
+        else:
+            raise UnpackError('Unsupported RarVM filter')
+        return mem[:out_size]
+
+    def _flush(self):
+        win = self._win
+        base = self._base
+        end = base + len(win)
+        wr = self._wrpos
+        stack = self._stack
+        i = 0
+        while i < len(stack):
+            start, length = stack[i][:2]
+            if not wr <= start < end:
+                i += 1
+                continue
+            if start != wr:
+                self._write(win[wr - base : start - base])
+                wr = start
+            if length > end - start:
+                self._wrpos = wr
+                return
+            data = self._execute(stack.pop(i), win[start - base : start - base + length])
+            while i < len(stack) and stack[i][0] == start and stack[i][1] == len(data):
+                data = self._execute(stack.pop(i), data)
+            self._write(data)
+            wr = start + length
+        self._write(win[wr - base :])
+        self._wrpos = end
+        self._trim()
+
+
+##
+## PPMd var.H
+##
+
+_UNIT_SIZE = 12
+_N_INDEXES = 38
+_MAX_O = 64
+_TOP = 1 << 24
+_BOT = 1 << 15
+_MASK32 = 0xffffffff
+_INT_BITS = 7
+_PERIOD_BITS = 7
+_TOT_BITS = _INT_BITS + _PERIOD_BITS
+_INTERVAL = 1 << _INT_BITS
+_BIN_SCALE = 1 << _TOT_BITS
+_MAX_FREQ = 124
+
+_EXP_ESCAPE = (25, 14, 9, 7, 5, 5, 4, 4, 4, 3, 3, 3, 2, 2, 2, 2)
+_INIT_BIN_ESC = (0x3CDD, 0x1F3F, 0x59BF, 0x48F3, 0x64A1, 0x5ABC, 0x6632, 0x6051)
+
+
+def _make_units():
+    indx2units = []
+    k = 1
+    for step, cnt in ((1, 4), (2, 4), (3, 4), (4, 26)):
+        for _ in range(cnt):
+            indx2units.append(k)
+            k += step
+        k += 1 if step < 4 else 0
+    units2indx = []
+    i = 0
+    for k in range(128):
+        if indx2units[i] < k + 1:
+            i += 1
+        units2indx.append(i)
+    return tuple(indx2units), tuple(units2indx)
+
+_INDX2UNITS, _UNITS2INDX = _make_units()
+
+
+def _make_ns2indx():
+    res = [0, 1, 2]
+    m, k, step = 3, 1, 1
+    for _ in range(3, 256):
+        res.append(m)
+        k -= 1
+        if not k:
+            step += 1
+            k = step
+            m += 1
+    return tuple(res)
+
+_NS2INDX = _make_ns2indx()
+_NS2BSINDX = (0, 2) + (4,) * 9 + (6,) * 245
+_HB2FLAG = (0,) * 0x40 + (8,) * 0xc0
+
+
+_S_SHORT = struct.Struct('<H')
+
+
+_unpack16 = _S_SHORT.unpack_from
+_unpack32 = _S_LONG.unpack_from
+_pack16 = _S_SHORT.pack_into
+_pack32 = _S_LONG.pack_into
+
+
+class _ModelPPM(object):
+    """PPMd var.H model with RAR's range decoder.
+
+    Model structures live in a bytearray heap that mirrors
+    the 12-byte unit layout of the original allocator, so
+    memory exhaustion restarts the model at the same points
+    as in unrar.
+
+    Context: NumStats u16 @0, SummFreq u16 @2, Stats u32 @4,
+    Suffix u32 @8; a binary context keeps its only State at @2.
+    State: Symbol @0, Freq @1, Successor u32 @2.
+    """
+
+    def __init__(self):
+        self.getc = None
+        self.heap = None
+        self.alloc_size = 0
+        self.min_context = self.max_context = 0
+        self.found_state = 0
+        self.low = self.code = self.range = 0
+        self.low_count = self.high_count = self.scale = 0
+        self.esc_count = 0
+        self.order_fall = 0
+        self.max_order = 0
+        self.run_length = self.init_rl = 0
+        self.init_esc = 0
+        self.num_masked = 0
+        self.prev_success = 0
+        self.hi_bits_flag = 0
+        self.char_mask = [0] * 256
+        self.bin_summ = [0] * (128 * 64)
+        self.see_summ = [0] * (25 * 16)
+        self.see_shift = [0] * (25 * 16)
+        self.see_count = [0] * (25 * 16)
+
+    def _swap(self, p, q):
+        h = self.heap
+        tmp = h[p : p + 6]
+        h[p : p + 6] = h[q : q + 6]
+        h[q : q + 6] = tmp
+
+    #
+    # sub-allocator
+    #
+
+    def _start_suballocator(self, mb):
+        size = mb << 20
+        if self.alloc_size == size:
+            return
+        alloc = size // _UNIT_SIZE * _UNIT_SIZE + 2 * _UNIT_SIZE
+        # keep address 0 as NULL
+        self.heap_start = _UNIT_SIZE
+        self.heap = bytearray(self.heap_start + alloc)
+        self.heap_end = self.heap_start + alloc - _UNIT_SIZE
+        self.alloc_size = size
+
+    def _stop_suballocator(self):
+        self.alloc_size = 0
+        self.heap = None
+
+    def _init_suballocator(self):
+        self.free_list = [[] for _ in range(_N_INDEXES)]
+        self.ptext = self.heap_start
+        size2 = _UNIT_SIZE * (self.alloc_size // 8 // _UNIT_SIZE * 7)
+        size1 = self.alloc_size - size2
+        real_size1 = size1 // _UNIT_SIZE * _UNIT_SIZE + _UNIT_SIZE
+        self.lo_unit = self.units_start = self.heap_start + real_size1
+        self.fake_units_start = self.heap_start + size1
+        self.hi_unit = self.lo_unit + size2
+        self.glue_count = 0
+
+    def _split_block(self, p, old_indx, new_indx):
+        diff = _INDX2UNITS[old_indx] - _INDX2UNITS[new_indx]
+        p += _UNIT_SIZE * _INDX2UNITS[new_indx]
+        i = _UNITS2INDX[diff - 1]
+        if _INDX2UNITS[i] != diff:
+            i -= 1
+            self.free_list[i].append(p)
+            p += _UNIT_SIZE * _INDX2UNITS[i]
+            diff -= _INDX2UNITS[i]
+        self.free_list[_UNITS2INDX[diff - 1]].append(p)
+
+    def _glue_free_blocks(self):
+        h = self.heap
+        if self.lo_unit != self.hi_unit:
+            h[self.lo_unit] = 0
+
+        # doubly-linked list of free blocks, each inserted at head
+        nxt = {None: None}
+        prv = {None: None}
+        for i in range(_N_INDEXES):
+            fl = self.free_list[i]
+            while fl:
+                p = fl.pop()
+                first = nxt[None]
+                nxt[p] = first
+                prv[p] = None
+                if first is None:
+                    prv[None] = p
+                else:
+                    prv[first] = p
+                nxt[None] = p
+                _pack16(h, p, 0xffff)
+                _pack16(h, p + 2, _INDX2UNITS[i])
+
+        p = nxt[None]
+        while p is not None:
+            while 1:
+                nu = _unpack16(h, p + 2)[0]
+                p1 = p + nu * _UNIT_SIZE
+                if _unpack16(h, p1)[0] != 0xffff:
+                    break
+                nu1 = _unpack16(h, p1 + 2)[0]
+                if nu + nu1 >= 0x10000:
+                    break
+                a, b = prv.pop(p1), nxt.pop(p1)
+                nxt[a] = b
+                prv[b] = a
+                _pack16(h, p + 2, (nu + nu1) & 0xffff)
+            p = nxt[p]
+
+        p = nxt[None]
+        while p is not None:
+            sz = _unpack16(h, p + 2)[0]
+            following = nxt[p]
+            while sz > 128:
+                self.free_list[_N_INDEXES - 1].append(p)
+                sz -= 128
+                p += 128 * _UNIT_SIZE
+            i = _UNITS2INDX[sz - 1]
+            if _INDX2UNITS[i] != sz:
+                i -= 1
+                k = sz - _INDX2UNITS[i]
+                self.free_list[k - 1].append(p + (sz - k) * _UNIT_SIZE)
+            self.free_list[i].append(p)
+            p = following
+
+    def _alloc_units_rare(self, indx):
+        if not self.glue_count:
+            self.glue_count = 255
+            self._glue_free_blocks()
+            if self.free_list[indx]:
+                return self.free_list[indx].pop()
+        i = indx
+        while 1:
+            i += 1
+            if i == _N_INDEXES:
+                self.glue_count -= 1
+                size = _UNIT_SIZE * _INDX2UNITS[indx]
+                if self.fake_units_start - self.ptext > size:
+                    self.fake_units_start -= size
+                    self.units_start -= size
+                    return self.units_start
+                return 0
+            if self.free_list[i]:
+                break
+        p = self.free_list[i].pop()
+        self._split_block(p, i, indx)
+        return p
+
+    def _alloc_units(self, nu):
+        indx = _UNITS2INDX[nu - 1]
+        if self.free_list[indx]:
+            return self.free_list[indx].pop()
+        p = self.lo_unit
+        lo = p + _UNIT_SIZE * _INDX2UNITS[indx]
+        if lo <= self.hi_unit:
+            self.lo_unit = lo
+            return p
+        return self._alloc_units_rare(indx)
+
+    def _alloc_context(self):
+        if self.hi_unit != self.lo_unit:
+            self.hi_unit -= _UNIT_SIZE
+            return self.hi_unit
+        if self.free_list[0]:
+            return self.free_list[0].pop()
+        return self._alloc_units_rare(0)
+
+    def _expand_units(self, old, old_nu):
+        i0 = _UNITS2INDX[old_nu - 1]
+        if i0 == _UNITS2INDX[old_nu]:
+            return old
+        p = self._alloc_units(old_nu + 1)
+        if p:
+            h = self.heap
+            n = _UNIT_SIZE * old_nu
+            h[p : p + n] = h[old : old + n]
+            self.free_list[i0].append(old)
+        return p
+
+    def _shrink_units(self, old, old_nu, new_nu):
+        i0 = _UNITS2INDX[old_nu - 1]
+        i1 = _UNITS2INDX[new_nu - 1]
+        if i0 == i1:
+            return old
+        if self.free_list[i1]:
+            p = self.free_list[i1].pop()
+            h = self.heap
+            n = _UNIT_SIZE * new_nu
+            h[p : p + n] = h[old : old + n]
+            self.free_list[i0].append(old)
+            return p
+        self._split_block(old, i0, i1)
+        return old
+
+    #
+    # model
+    #
+
+    def _restart_model(self):
+        h = self.heap
+        self.char_mask = [0] * 256
+        self._init_suballocator()
+        self.init_rl = -min(self.max_order, 12) - 1
+        ctx = self._alloc_context()
+        self.min_context = self.max_context = ctx
+        _pack32(h, ctx + 8, 0)
+        self.order_fall = self.max_order
+        _pack16(h, ctx, 256)
+        _pack16(h, ctx + 2, 257)
+        stats = self._alloc_units(256 // 2)
+        self.found_state = stats
+        _pack32(h, ctx + 4, stats)
+        for i in range(256):
+            p = stats + 6 * i
+            h[p] = i
+            h[p + 1] = 1
+            h[p + 2 : p + 6] = b'\0\0\0\0'
+        self.run_length = self.init_rl
+        self.prev_success = 0
+        bs = self.bin_summ
+        for i in range(128):
+            for k in range(8):
+                val = _BIN_SCALE - _INIT_BIN_ESC[k] // (i + 2)
+                for m in range(0, 64, 8):
+                    bs[i * 64 + k + m] = val
+        for i in range(25):
+            for k in range(16):
+                self.see_summ[i * 16 + k] = (5 * i + 10) << (_PERIOD_BITS - 4)
+                self.see_shift[i * 16 + k] = _PERIOD_BITS - 4
+                self.see_count[i * 16 + k] = 4
+
+    def _start_model(self, max_order):
+        self.esc_count = 1
+        self.max_order = max_order
+        self._restart_model()
+
+    def _clear_mask(self):
+        self.esc_count = 1
+        self.char_mask = [0] * 256
+
+    def cleanup(self):
+        """Reset model after corrupt data."""
+        self._stop_suballocator()
+        self._start_suballocator(1)
+        self._start_model(2)
+
+    def decode_init(self, getc, esc_char):
+        """Start PPM block, return (success, escape char)."""
+        self.getc = getc
+        max_order = getc()
+        reset = max_order & 0x20
+        if reset:
+            max_mb = getc()
+        elif not self.alloc_size:
+            return False, esc_char
+        if max_order & 0x40:
+            esc_char = getc()
+        self.low = self.code = 0
+        self.range = _MASK32
+        for _ in range(4):
+            self.code = (self.code << 8) | getc()
+        if reset:
+            max_order = (max_order & 0x1f) + 1
+            if max_order > 16:
+                max_order = 16 + (max_order - 16) * 3
+            if max_order == 1:
+                self._stop_suballocator()
+                return False, esc_char
+            self._start_suballocator(max_mb + 1)
+            self._start_model(max_order)
+        return self.min_context != 0, esc_char
+
+    def _normalize(self):
+        low, rng, code = self.low, self.range, self.code
+        getc = self.getc
+        while 1:
+            if (low ^ ((low + rng) & _MASK32)) >= _TOP:
+                if rng >= _BOT:
+                    break
+                rng = -low & (_BOT - 1)
+            code = ((code << 8) | getc()) & _MASK32
+            rng = (rng << 8) & _MASK32
+            low = (low << 8) & _MASK32
+        self.low, self.range, self.code = low, rng, code
+
+    def _decode(self):
+        self.low = (self.low + self.range * self.low_count) & _MASK32
+        self.range = (self.range * (self.high_count - self.low_count)) & _MASK32
+
+    def decode_char(self):
+        """Decode next symbol, -1 on corrupt data."""
+        h = self.heap
+        mc = self.min_context
+        if mc <= self.ptext or mc > self.heap_end:
+            return -1
+        if _unpack16(h, mc)[0] != 1:
+            stats = _unpack32(h, mc + 4)[0]
+            if stats <= self.ptext or stats > self.heap_end:
+                return -1
+            if not self._decode_symbol1(mc):
+                return -1
+        else:
+            self._decode_bin_symbol(mc)
+        self._decode()
+        while not self.found_state:
+            self._normalize()
+            while 1:
+                self.order_fall += 1
+                mc = _unpack32(h, mc + 8)[0]
+                if mc <= self.ptext or mc > self.heap_end:
+                    return -1
+                if _unpack16(h, mc)[0] != self.num_masked:
+                    break
+            self.min_context = mc
+            if not self._decode_symbol2(mc):
+                return -1
+            self._decode()
+        fs = self.found_state
+        symbol = h[fs]
+        successor = _unpack32(h, fs + 2)[0]
+        if not self.order_fall and successor > self.ptext:
+            self.min_context = self.max_context = successor
+        else:
+            self._update_model()
+            if self.esc_count == 0:
+                self._clear_mask()
+        self._normalize()
+        return symbol
+
+    def _decode_bin_symbol(self, ctx):
+        h = self.heap
+        rs = ctx + 2
+        sym = h[rs]
+        freq = h[rs + 1]
+        self.hi_bits_flag = _HB2FLAG[h[self.found_state]]
+        idx = ((freq - 1) * 64 + self.prev_success
+               + _NS2BSINDX[_unpack16(h, _unpack32(h, ctx + 8)[0])[0] - 1]
+               + self.hi_bits_flag + 2 * _HB2FLAG[sym]
+               + ((self.run_length >> 26) & 0x20))
+        bs = self.bin_summ[idx]
+        self.range >>= _TOT_BITS
+        if ((self.code - self.low) & _MASK32) // self.range < bs:
+            self.found_state = rs
+            if freq < 128:
+                h[rs + 1] = freq + 1
+            self.low_count = 0
+            self.high_count = bs
+            self.bin_summ[idx] = (bs + _INTERVAL - ((bs + 32) >> 7)) & 0xffff
+            self.prev_success = 1
+            self.run_length += 1
+        else:
+            self.low_count = bs
+            bs = (bs - ((bs + 32) >> 7)) & 0xffff
+            self.bin_summ[idx] = bs
+            self.high_count = _BIN_SCALE
+            self.init_esc = _EXP_ESCAPE[bs >> 10]
+            self.num_masked = 1
+            self.char_mask[sym] = self.esc_count
+            self.prev_success = 0
+            self.found_state = 0
+
+    def _decode_symbol1(self, ctx):
+        h = self.heap
+        scale = _unpack16(h, ctx + 2)[0]
+        self.scale = scale
+        p = _unpack32(h, ctx + 4)[0]
+        self.range //= scale
+        count = ((self.code - self.low) & _MASK32) // self.range
+        if count >= scale:
+            return False
+        hicnt = h[p + 1]
+        if count < hicnt:
+            self.high_count = hicnt
+            self.prev_success = 1 if 2 * hicnt > scale else 0
+            self.run_length += self.prev_success
+            self.found_state = p
+            hicnt += 4
+            h[p + 1] = hicnt
+            _pack16(h, ctx + 2, (scale + 4) & 0xffff)
+            if hicnt > _MAX_FREQ:
+                self._rescale(ctx)
+            self.low_count = 0
+            return True
+        elif not self.found_state:
+            return False
+        self.prev_success = 0
+        i = _unpack16(h, ctx)[0] - 1
+        while 1:
+            p += 6
+            hicnt += h[p + 1]
+            if hicnt > count:
+                break
+            i -= 1
+            if i == 0:
+                self.hi_bits_flag = _HB2FLAG[h[self.found_state]]
+                self.low_count = hicnt
+                mask = self.char_mask
+                esc = self.esc_count
+                self.num_masked = _unpack16(h, ctx)[0]
+                for q in range(_unpack32(h, ctx + 4)[0], p + 6, 6):
+                    mask[h[q]] = esc
+                self.found_state = 0
+                self.high_count = scale
+                return True
+        self.high_count = hicnt
+        self.low_count = hicnt - h[p + 1]
+        self._update1(ctx, p)
+        return True
+
+    def _update1(self, ctx, p):
+        h = self.heap
+        self.found_state = p
+        h[p + 1] += 4
+        _pack16(h, ctx + 2, (_unpack16(h, ctx + 2)[0] + 4) & 0xffff)
+        if h[p + 1] > h[p - 5]:
+            self._swap(p, p - 6)
+            p -= 6
+            self.found_state = p
+            if h[p + 1] > _MAX_FREQ:
+                self._rescale(ctx)
+
+    def _update2(self, ctx, p):
+        h = self.heap
+        self.found_state = p
+        h[p + 1] += 4
+        _pack16(h, ctx + 2, (_unpack16(h, ctx + 2)[0] + 4) & 0xffff)
+        if h[p + 1] > _MAX_FREQ:
+            self._rescale(ctx)
+        self.esc_count = (self.esc_count + 1) & 0xff
+        self.run_length = self.init_rl
+
+    def _make_esc_freq2(self, ctx, diff):
+        h = self.heap
+        ns = _unpack16(h, ctx)[0]
+        if ns == 256:
+            self.scale = 1
+            return -1
+        idx = (_NS2INDX[diff - 1] * 16
+               + (diff < _unpack16(h, _unpack32(h, ctx + 8)[0])[0] - ns)
+               + 2 * (_unpack16(h, ctx + 2)[0] < 11 * ns)
+               + 4 * (self.num_masked > diff)
+               + self.hi_bits_flag)
+        summ = self.see_summ[idx]
+        ret = summ >> self.see_shift[idx]
+        self.see_summ[idx] = (summ - ret) & 0xffff
+        self.scale = ret + (ret == 0)
+        return idx
+
+    def _decode_symbol2(self, ctx):
+        h = self.heap
+        ns = _unpack16(h, ctx)[0]
+        i = ns - self.num_masked
+        see = self._make_esc_freq2(ctx, i)
+        mask = self.char_mask
+        esc = self.esc_count
+        stats = _unpack32(h, ctx + 4)[0]
+        ps = [p for p in range(stats, stats + 6 * ns, 6) if mask[h[p]] != esc]
+        if len(ps) != i:
+            return False
+        hicnt = sum([h[p + 1] for p in ps])
+        scale = self.scale + hicnt
+        self.scale = scale
+        self.range //= scale
+        count = ((self.code - self.low) & _MASK32) // self.range
+        if count >= scale:
+            return False
+        if count < hicnt:
+            hicnt = 0
+            for p in ps:
+                hicnt += h[p + 1]
+                if hicnt > count:
+                    break
+            self.high_count = hicnt
+            self.low_count = hicnt - h[p + 1]
+            if see >= 0 and self.see_shift[see] < _PERIOD_BITS:
+                self.see_count[see] = (self.see_count[see] - 1) & 0xff
+                if self.see_count[see] == 0:
+                    self.see_summ[see] = (self.see_summ[see] * 2) & 0xffff
+                    self.see_count[see] = (3 << self.see_shift[see]) & 0xff
+                    self.see_shift[see] += 1
+            self._update2(ctx, p)
+        else:
+            self.low_count = hicnt
+            self.high_count = scale
+            for p in ps:
+                mask[h[p]] = esc
+            if see >= 0:
+                self.see_summ[see] = (self.see_summ[see] + scale) & 0xffff
+            self.num_masked = ns
+        return True
+
+    def _rescale(self, ctx):
+        h = self.heap
+        old_ns = _unpack16(h, ctx)[0]
+        i = old_ns - 1
+        stats = _unpack32(h, ctx + 4)[0]
+        p = self.found_state
+        while p != stats:
+            self._swap(p, p - 6)
+            p -= 6
+        h[stats + 1] += 4
+        summ = (_unpack16(h, ctx + 2)[0] + 4) & 0xffff
+        esc_freq = summ - h[stats + 1]
+        adder = 1 if self.order_fall != 0 else 0
+        freq = (h[stats + 1] + adder) >> 1
+        h[stats + 1] = freq
+        summ = freq
+        while 1:
+            p += 6
+            esc_freq -= h[p + 1]
+            freq = (h[p + 1] + adder) >> 1
+            h[p + 1] = freq
+            summ += freq
+            if freq > h[p - 5]:
+                tmp = h[p : p + 6]
+                p1 = p
+                while 1:
+                    h[p1 : p1 + 6] = h[p1 - 6 : p1]
+                    p1 -= 6
+                    if p1 == stats or freq <= h[p1 - 5]:
+                        break
+                h[p1 : p1 + 6] = tmp
+            i -= 1
+            if i == 0:
+                break
+        ns = old_ns
+        if h[p + 1] == 0:
+            i = 0
+            while 1:
+                i += 1
+                p -= 6
+                if h[p + 1] != 0:
+                    break
+            esc_freq += i
+            ns = old_ns - i
+            _pack16(h, ctx, ns)
+            if ns == 1:
+                tmp = h[stats : stats + 6]
+                while 1:
+                    tmp[1] -= tmp[1] >> 1
+                    esc_freq >>= 1
+                    if esc_freq <= 1:
+                        break
+                self.free_list[_UNITS2INDX[((old_ns + 1) >> 1) - 1]].append(stats)
+                self.found_state = ctx + 2
+                h[ctx + 2 : ctx + 8] = tmp
+                return
+        esc_freq -= esc_freq >> 1
+        _pack16(h, ctx + 2, (summ + esc_freq) & 0xffff)
+        n0 = (old_ns + 1) >> 1
+        n1 = (ns + 1) >> 1
+        if n0 != n1:
+            stats = self._shrink_units(stats, n0, n1)
+            _pack32(h, ctx + 4, stats)
+        self.found_state = stats
+
+    def _create_child(self, ctx, ps, state):
+        pc = self._alloc_context()
+        if pc:
+            h = self.heap
+            _pack16(h, pc, 1)
+            h[pc + 2 : pc + 8] = state
+            _pack32(h, pc + 8, ctx)
+            _pack32(h, ps + 2, pc)
+        return pc
+
+    def _create_successors(self, skip, p1):
+        h = self.heap
+        pc = self.min_context
+        fs = self.found_state
+        fsym = h[fs]
+        up_branch = _unpack32(h, fs + 2)[0]
+        ps = []
+        if not skip:
+            ps.append(fs)
+        if skip or _unpack32(h, pc + 8)[0]:
+            if p1:
+                p = p1
+                pc = _unpack32(h, pc + 8)[0]
+            while 1:
+                if p1:
+                    p1 = 0
+                else:
+                    pc = _unpack32(h, pc + 8)[0]
+                    if _unpack16(h, pc)[0] != 1:
+                        p = _unpack32(h, pc + 4)[0]
+                        while h[p] != fsym:
+                            p += 6
+                    else:
+                        p = pc + 2
+                succ = _unpack32(h, p + 2)[0]
+                if succ != up_branch:
+                    pc = succ
+                    break
+                if len(ps) >= _MAX_O:
+                    return 0
+                ps.append(p)
+                if not _unpack32(h, pc + 8)[0]:
+                    break
+        if not ps:
+            return pc
+        up_sym = h[up_branch]
+        if _unpack16(h, pc)[0] != 1:
+            if pc <= self.ptext:
+                return 0
+            p = _unpack32(h, pc + 4)[0]
+            while h[p] != up_sym:
+                p += 6
+            cf = h[p + 1] - 1
+            s0 = _unpack16(h, pc + 2)[0] - _unpack16(h, pc)[0] - cf
+            if 2 * cf <= s0:
+                up_freq = 1 + (5 * cf > s0)
+            else:
+                up_freq = 1 + (2 * cf + 3 * s0 - 1) // (2 * s0)
+        else:
+            up_freq = h[pc + 3]
+        state = bytearray(6)
+        state[0] = up_sym
+        state[1] = up_freq
+        _S_LONG.pack_into(state, 2, up_branch + 1)
+        while ps:
+            pc = self._create_child(pc, ps.pop(), state)
+            if not pc:
+                return 0
+        return pc
+
+    def _update_model(self):
+        h = self.heap
+        fs_ptr = self.found_state
+        fs_sym = h[fs_ptr]
+        fs_freq = h[fs_ptr + 1]
+        fs_succ = _unpack32(h, fs_ptr + 2)[0]
+        p = 0
+        if fs_freq < _MAX_FREQ // 4:
+            pc = _unpack32(h, self.min_context + 8)[0]
+            if pc:
+                if _unpack16(h, pc)[0] != 1:
+                    p = _unpack32(h, pc + 4)[0]
+                    if h[p] != fs_sym:
+                        while 1:
+                            p += 6
+                            if h[p] == fs_sym:
+                                break
+                        if h[p + 1] >= h[p - 5]:
+                            self._swap(p, p - 6)
+                            p -= 6
+                    if h[p + 1] < _MAX_FREQ - 9:
+                        h[p + 1] += 2
+                        _pack16(h, pc + 2, (_unpack16(h, pc + 2)[0] + 2) & 0xffff)
+                else:
+                    p = pc + 2
+                    if h[p + 1] < 32:
+                        h[p + 1] += 1
+
+        if not self.order_fall:
+            ctx = self._create_successors(True, p)
+            _pack32(h, self.found_state + 2, ctx)
+            self.min_context = self.max_context = ctx
+            if not ctx:
+                self._restart_and_clear()
+            return
+
+        h[self.ptext] = fs_sym
+        self.ptext += 1
+        successor = self.ptext
+        if self.ptext >= self.fake_units_start:
+            self._restart_and_clear()
+            return
+        if fs_succ:
+            if fs_succ <= self.ptext:
+                fs_succ = self._create_successors(False, p)
+                if not fs_succ:
+                    self._restart_and_clear()
+                    return
+            self.order_fall -= 1
+            if not self.order_fall:
+                successor = fs_succ
+                if self.max_context != self.min_context:
+                    self.ptext -= 1
+        else:
+            _pack32(h, self.found_state + 2, successor)
+            fs_succ = self.min_context
+
+        mc = self.min_context
+        ns = _unpack16(h, mc)[0]
+        s0 = _unpack16(h, mc + 2)[0] - ns - (fs_freq - 1)
+        pc = self.max_context
+        while pc != mc:
+            ns1 = _unpack16(h, pc)[0]
+            if ns1 != 1:
+                if (ns1 & 1) == 0:
+                    stats = self._expand_units(_unpack32(h, pc + 4)[0], ns1 >> 1)
+                    _pack32(h, pc + 4, stats)
+                    if not stats:
+                        self._restart_and_clear()
+                        return
+                summ = _unpack16(h, pc + 2)[0]
+                summ += (2 * ns1 < ns) + 2 * ((4 * ns1 <= ns) & (summ <= 8 * ns1))
+                _pack16(h, pc + 2, summ & 0xffff)
+            else:
+                p = self._alloc_units(1)
+                if not p:
+                    self._restart_and_clear()
+                    return
+                h[p : p + 6] = h[pc + 2 : pc + 8]
+                _pack32(h, pc + 4, p)
+                freq = h[p + 1]
+                if freq < _MAX_FREQ // 4 - 1:
+                    freq += freq
+                else:
+                    freq = _MAX_FREQ - 4
+                h[p + 1] = freq
+                _pack16(h, pc + 2, (freq + self.init_esc + (ns > 3)) & 0xffff)
+            summ = _unpack16(h, pc + 2)[0]
+            cf = 2 * fs_freq * (summ + 6)
+            sf = s0 + summ
+            if cf < 6 * sf:
+                cf = 1 + (cf > sf) + (cf >= 4 * sf)
+                summ += 3
+            else:
+                cf = 4 + (cf >= 9 * sf) + (cf >= 12 * sf) + (cf >= 15 * sf)
+                summ += cf
+            _pack16(h, pc + 2, summ & 0xffff)
+            p = _unpack32(h, pc + 4)[0] + ns1 * 6
+            h[p] = fs_sym
+            h[p + 1] = cf
+            _pack32(h, p + 2, successor)
+            _pack16(h, pc, (ns1 + 1) & 0xffff)
+            pc = _unpack32(h, pc + 8)[0]
+        self.max_context = self.min_context = fs_succ
+
+    def _restart_and_clear(self):
+        self._restart_model()
+        self.esc_count = 0
@@ -9,7 +9,8 @@ import re
 from contextlib import closing
 from json import loads
 from urllib import quote_plus
-from urllib2 import urlopen
+from scruhtml import SCRuSearchIndex
+from scruhttp import get_session
 
 class SCRuAPI:
     """
@@ -18,6 +19,16 @@ class SCRuAPI:
 
     def __init__(self):
         self.logger = None
+
+        self.session = get_session()
+        """:type: SCRuHTTPSession"""
+
+        self.cache = None
+        """:type: SCRuSearchCache"""
+
+        self.negative_cache = None
+        """:type: SCRuNegativeCache"""
+
         self._base_url = u'http://subs.com.ru'
 
     def search(self, title, year):
@@ -34,10 +45,20 @@ class SCRuAPI:
 
         self.logger.debug(u'Looking for {0} ({1})'.format(title, year))
 
+        if self.cache:
+            cached = self.cache.get(title, year)
+            if cached:
+                self.logger.debug(u'Download page for {0} ({1}) found in cache: {2}'.format(title, year, cached[1]))
+                return list(cached)
+
+        if self.negative_cache and self.negative_cache.get(title, year):
+            self.logger.info(u'Skipping {0} ({1}), no subtitles found by a recent search'.format(title, year))
+            return [None, None]
+
         """url = u'{0}/?t={1}&y={2}'.format(self._base_url, quote_plus(title), year)"""
         url = u'{0}/index.php?e=search&sq={1}'.format(self._base_url, quote_plus(title))
 
-        with closing(urlopen(url)) as f:
+        with closing(self.session.open(url)) as f:
             response = f.read().decode('string-escape').decode("utf-8")
 
         #self.logger.debug(response)
@@ -49,7 +70,9 @@ class SCRuAPI:
         match = pattern.search(response)
         if match:
             self.logger.warn(u'No match found for {0} ({1})'.format(title, year))
-            return None
+            if self.negative_cache:
+                self.negative_cache.put(title, year)
+            return [None, None]
 
         # if isinstance(self._no_results(response), unicode ):
         #     self.logger.warn(u'No match found for {0} ({1})'.format(title, year))
@@ -63,20 +86,28 @@ class SCRuAPI:
         #self.logger.debug(u'response HTML:' + response )
         self.logger.debug(u'\n')
 
-        subsearch = self._search_within_results(response, year)
+        candidates = self._search_within_results(response, title, year)
 
-        if subsearch is None:
+        if not candidates:
             #bail
             self.logger.info(u'No subtitles found for the title \"{0}\" and year ({1})'.format(title, year))
+            if self.negative_cache:
+                self.negative_cache.put(title, year)
             return [None, None]
         else:
-            #potential error here
-            downloadpageurl = u'{0}/{1}'.format(self._base_url, subsearch )
-            self.logger.debug(u'Download page URL: {0}'.format(downloadpageurl) )
-            with closing( urlopen(downloadpageurl) ) as resultf:
+            for candidate in candidates[1:]:
+                self.logger.debug(u'Other candidate: {0} ({1}) {2}'.format(candidate['title'], candidate['date'],
+                                                                          candidate['url']))
+            downloadpageurl = u'{0}/{1}'.format(self._base_url, candidates[0]['url'])
+            self.logger.debug(u'Download page URL for {0} ({1}): {2}'.format(candidates[0]['title'],
+                                                                          candidates[0]['date'], downloadpageurl))
+            with closing(self.session.open(downloadpageurl)) as resultf:
                 response = resultf.read().decode('string-escape').decode("utf-8")
                 #self.logger.debug(u'response HTML:' + response )
-                return [response, downloadpageurl]
+
+            if self.cache:
+                self.cache.put(title, year, response, downloadpageurl)
+            return [response, downloadpageurl]
 
 
 
@@ -89,18 +120,17 @@ class SCRuAPI:
     #     #return match
 
     @staticmethod
-    def _search_within_results(page, year):
-        """Get the subtitle archive URL from the subtitle page.
+    def _search_within_results(page, title, year):
+        """Rank the download pages listed on the search results page.
 
         :param page: Film search results page
         :type page: unicode
-        :return: Subtitle URL
-        :rtype: unicode
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: int | unicode
+        :return: Candidates released within a year of the movie, best title match first
+        :rtype: list of dict of [str, unicode|int]
         """
 
-        pattern = re.compile(r'a href="(page.php\?id=[0-9]*)\&.*[\s].*[\s].*[0-9]{2}\/[0-9]{2}\/('+year+')', re.UNICODE)
-        match = pattern.search(page)
-        return unicode(match.group(1)) if match else None
-
-
-
+        return SCRuSearchIndex(page).lookup(title, year)
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+
+
+import BaseHTTPServer
+import os
+import re
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import timeit
+from io import BytesIO
+import rarfile
+from scruhtml import SCRuResultScanner
+
+
+# pattern formerly used by SCRuSubtitles._list_subtitles
+RESULT_PATTERN = re.compile(r'<li data-id=".*?"(?: class="((?:high|low)-rating)")?>\s*'
+                            r'<span class="rating">\s*(?:<span.*?>.*?</span>\s*)*</span>\s*'
+                            r'<a class="subtitle-page" href="(.*?)">\s*'
+                            r'<span class="flag flag-.*?">.*?</span>\s*'
+                            r'<span>(.*?)</span>.*?'
+                            r'<span class="subdesc">.*?</span>\s*'
+                            r'(?:<span class="verified-subtitle" title="verified">.*?</span>\s*)?'
+                            r'</a>'
+                            r'.*?'
+                            r'</li>',
+                            re.UNICODE)
+
+# the site emits every result item on a single line
+RESULT_ITEM = (u'<li data-id="{0}"{1}> '
+               u'<span class="rating"> '
+               u'<span class="good" title="good">{2}</span> '
+               u'<span class="bad" title="bad">0</span> '
+               u'</span> '
+               u'<a class="subtitle-page" href="/subtitles/{0}/"> '
+               u'<span class="flag flag-{3}">{3}</span> '
+               u'<span>{4}</span> '
+               u'<span class="subdesc">Movie.Title.{0}.720p.BluRay.x264</span> '
+               u'{5}'
+               u'</a> '
+               u'<div class="uploader">uploaded by <a href="/user/{0}/">user{0}</a></div>'
+               u'</li>\n')
+
+
+def result_page(count):
+    """Build a result page shaped like the subs.com.ru markup."""
+
+    items = []
+    for i in range(count):
+        items.append(RESULT_ITEM.format(
+            i,
+            (u'', u' class="high-rating"', u' class="low-rating"')[i % 3],
+            i % 7,
+            (u'ru', u'gb')[i % 2],
+            (u'Russian', u'English')[i % 2],
+            u'<span class="verified-subtitle" title="verified">v</span> ' if i % 4 == 0 else u''))
+    return u'<html><body><ul class="subtitles">\n' + u''.join(items) + u'</ul></body></html>'
+
+
+def bench_results(sizes=(10, 100, 1000, 5000), repeat=3):
+    for count in sizes:
+        page = result_page(count)
+
+        expected = [(m[0] or None, m[1], m[2]) for m in RESULT_PATTERN.findall(page)]
+        found = [(r['rating'], r['page_url'], r['language']) for r in SCRuResultScanner.scan(page)]
+        assert found == expected, 'scanner and regex disagree on {0} items'.format(count)
+
+        regex = min(timeit.repeat(lambda: RESULT_PATTERN.findall(page), number=1, repeat=repeat))
+        scanner = min(timeit.repeat(lambda: SCRuResultScanner.scan(page), number=1, repeat=repeat))
+        print('results {0:>6} items {1:>9} chars: regex {2:8.4f}s  scanner {3:8.4f}s'.format(
+            count, len(page), regex, scanner))
+
+
+def bench_degraded(sizes=(1, 2), repeat=3):
+    """Time a minified page whose items lack the description the regex expects."""
+
+    for count in sizes:
+        page = result_page(count).replace(u'\n', u'').replace(u'class="subdesc"', u'class="desc"')
+
+        assert len(SCRuResultScanner.scan(page)) == count
+
+        regex = min(timeit.repeat(lambda: RESULT_PATTERN.findall(page), number=1, repeat=repeat))
+        scanner = min(timeit.repeat(lambda: SCRuResultScanner.scan(page), number=1, repeat=repeat))
+        print('degraded {0:>5} items {1:>9} chars: regex {2:8.4f}s  scanner {3:8.4f}s'.format(
+            count, len(page), regex, scanner))
+
+
+def bench_unpack(paths, repeat=3):
+    """Time reading every member of RAR archives in-process and through unrar."""
+
+    def read_all(path):
+        with rarfile.RarFile(path) as z:
+            return [z.read(info) for info in z.infolist() if not info.isdir()]
+
+    orig_python_unpack = rarfile.USE_PYTHON_UNPACK
+    for path in paths:
+        rarfile.USE_PYTHON_UNPACK = 1
+        data = read_all(path)
+        python = min(timeit.repeat(lambda: read_all(path), number=1, repeat=repeat))
+        rarfile.USE_PYTHON_UNPACK = 0
+        try:
+            assert read_all(path) == data, 'unrar and rarunpack disagree on {0}'.format(path)
+            unrar = '{0:8.4f}s'.format(min(timeit.repeat(lambda: read_all(path), number=1, repeat=repeat)))
+        except rarfile.RarCannotExec:
+            unrar = ' missing'
+        finally:
+            rarfile.USE_PYTHON_UNPACK = orig_python_unpack
+        print('unpack {0:>3} files {1:>9} bytes: python {2:8.4f}s  unrar {3}  ({4})'.format(
+            len(data), sum(len(d) for d in data), python, unrar, path))
+
+
+def bench_read_many(paths, repeat=3):
+    """Time reading every member through unrar, one run per member and one run for all."""
+
+    def read_each(path):
+        with rarfile.RarFile(path) as z:
+            return [z.read(info) for info in z.infolist() if not info.isdir()]
+
+    def read_many(path):
+        with rarfile.RarFile(path) as z:
+            return z.read_many([info for info in z.infolist() if not info.isdir()])
+
+    orig_python_unpack = rarfile.USE_PYTHON_UNPACK
+    rarfile.USE_PYTHON_UNPACK = 0
+    try:
+        for path in paths:
+            try:
+                data = read_each(path)
+                assert read_many(path) == data, 'read and read_many disagree on {0}'.format(path)
+            except rarfile.RarCannotExec:
+                print('read_many: unrar missing')
+                return
+            each = min(timeit.repeat(lambda: read_each(path), number=1, repeat=repeat))
+            many = min(timeit.repeat(lambda: read_many(path), number=1, repeat=repeat))
+            print('unrar {0:>4} files {1:>9} bytes: read {2:8.4f}s  read_many {3:8.4f}s  ({4})'.format(
+                len(data), sum(len(d) for d in data), each, many, path))
+    finally:
+        rarfile.USE_PYTHON_UNPACK = orig_python_unpack
+
+
+def bench_listing(paths, repeat=3):
+    """Time listing RAR archives."""
+
+    def listing(path):
+        with rarfile.RarFile(path) as z:
+            return [(info.filename, info.file_size, info.CRC) for info in z.infolist()]
+
+    for path in paths:
+        count = len(listing(path))
+        elapsed = min(timeit.repeat(lambda: listing(path), number=1, repeat=repeat))
+        print('list {0:>5} entries: {1:8.4f}s  ({2})'.format(count, elapsed, path))
+
+
+def check_stream(paths):
+    """Check that stream mode lists and reads archives like a full parse, split files included."""
+
+    def entries(z, infos):
+        # read while the stream parse is still going
+        return [(info.filename, info.file_size, info.CRC, z.read(info))
+                for info in infos if not info.isdir() and not info.needs_password()]
+
+    for path in paths:
+        with rarfile.RarFile(path) as z:
+            full = entries(z, z.infolist())
+        with rarfile.RarFile(path, stream=True) as z:
+            streamed = entries(z, z.iterinfo())
+            volumes = len(z.volumelist())
+        assert streamed == full, 'stream mode and full parse disagree on {0}'.format(path)
+        print('stream {0:>4} files {1:>3} volumes: ok  ({2})'.format(len(full), volumes, path))
+
+
+def check_filtered_links(paths):
+    """Check that file copies and hard links read the same when member_filter leaves out their target."""
+
+    links = (rarfile.RAR5_XREDIR_FILE_COPY, rarfile.RAR5_XREDIR_HARD_LINK)
+    for path in paths:
+        with rarfile.RarFile(path) as z:
+            names = [info.filename for info in z.infolist() if info.file_redir and info.file_redir[0] in links]
+            data = [z.read(name) for name in names]
+        for name, expected in zip(names, data):
+            with rarfile.RarFile(path, member_filter=lambda n: n == name) as z:
+                assert z.read(name) == expected, 'filtered read of {0} differs in {1}'.format(name, path)
+        if names:
+            print('filtered {0:>4} links: ok  ({1})'.format(len(names), path))
+
+
+class ArchiveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve server.archive at /archive.rar with Range support, redirecting download links to it."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.endswith('&a=dl'):
+            self.send_response(302)
+            self.send_header('Location', '/archive.rar')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = self.server.archive
+        ranged = self.headers.getheader('Range')
+        self.server.requests.append(ranged)
+        if ranged:
+            start, end = [int(v) for v in ranged.split('=')[1].split('-')]
+            end = min(end, len(data) - 1)
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArchiveServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def check_archive_store(paths):
+    """Check that an archive listed through Range requests is downloaded in full once, then taken from the store."""
+
+    from scrucache import SCRuArchiveStore
+    from scrusubtitles import SCRuSubtitles
+
+    class Listener(object):
+        def __init__(self):
+            self.found = []
+
+        def on_subtitle_found(self, subtitle):
+            self.found.append(subtitle)
+
+        def on_subtitle_downloaded(self, path):
+            pass
+
+        def debug(self, message):
+            pass
+
+        info = warn = error = debug
+
+    server = ArchiveServer(('127.0.0.1', 0), ArchiveHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    workdir = tempfile.mkdtemp()
+    try:
+        for path in paths:
+            with open(path, 'rb') as f:
+                server.archive = f.read()
+            server.requests = []
+            subtitles = SCRuSubtitles()
+            subtitles.listener = subtitles.logger = Listener()
+            subtitles.workdir = workdir
+            subtitles.archives = SCRuArchiveStore(os.path.join(workdir, 'store'))
+            subtitles._list_subtitles_archive({
+                'referer': 'http://127.0.0.1:{0}{1}'.format(server.server_port, path.replace(os.sep, '/')),
+                'url': os.path.basename(path),
+            })
+            if not subtitles.listener.found:
+                continue
+
+            found = subtitles.listener.found[0]
+            listed = len(server.requests)
+            assert None not in server.requests, 'listing {0} did not use Range requests'.format(path)
+            full = []
+            for attempt in range(2):
+                start = len(server.requests)
+                subtitles.download(found['download_uri'], found['filename'])
+                full.append(server.requests[start:].count(None))
+            assert subtitles.archives.get(found['download_uri']) == server.archive, \
+                'store does not hold {0}'.format(path)
+            assert full[0] <= 1 and full[1] == 0, '{0} was downloaded {1} times'.format(path, sum(full))
+            print('store {0:>4} ranged requests, {1} full download(s): ok  ({2})'.format(listed, full[0], path))
+            shutil.rmtree(os.path.join(workdir, 'store'))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+
+
+def record_size(obj):
+    """Size of object with its attribute dict, if it has one."""
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def bench_info_memory(paths):
+    """Measure memory held per archive entry after listing RAR archives.
+
+    Records count the entry objects with their attribute storage, total also
+    counts field values and lookup tables where tracemalloc is available.
+    """
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    for path in paths:
+        if tracemalloc:
+            tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0] if tracemalloc else 0
+            with rarfile.RarFile(path) as z:
+                infos = z.infolist()
+                used = tracemalloc.get_traced_memory()[0] - base if tracemalloc else 0
+        finally:
+            if tracemalloc:
+                tracemalloc.stop()
+        count = float(max(len(infos), 1))
+        record = sum(record_size(info) for info in infos)
+        total = '{0:6.0f}'.format(used / count) if tracemalloc else '     ?'
+        print('info memory {0:>5} entries: record {1:6.0f}  total {2} bytes per entry  ({3})'.format(
+            len(infos), record / count, total, path))
+
+
+class BlockCountingFile(BytesIO):
+    """In-memory file that counts the blocks a ranged reader would have to fetch."""
+
+    block_size = 8 * 1024
+
+    def __init__(self, data):
+        BytesIO.__init__(self, data)
+        self.blocks = set()
+
+    def read(self, n=-1):
+        pos = self.tell()
+        data = BytesIO.read(self, n)
+        if data:
+            self.blocks.update(range(pos // self.block_size, (pos + len(data) - 1) // self.block_size + 1))
+        return data
+
+
+def bench_quick_open(paths, repeat=3):
+    """Count blocks read and time listing RAR archives with and without the RAR5 quick open record."""
+
+    def listing(data):
+        f = BlockCountingFile(data)
+        with rarfile.RarFile(f) as z:
+            return [(info.filename, info.file_size, info.CRC) for info in z.infolist()], len(f.blocks)
+
+    orig_quick_open = rarfile.USE_QUICK_OPEN
+    try:
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            res = []
+            for use_quick_open in (0, 1):
+                rarfile.USE_QUICK_OPEN = use_quick_open
+                res.append(listing(data) + (min(timeit.repeat(lambda: listing(data), number=1, repeat=repeat)),))
+            assert res[0][0] == res[1][0], 'walked and quick open listings differ for {0}'.format(path)
+            print('quick open {0:>5} entries: walk {1:>4} blocks {2:8.4f}s  quick open {3:>4} blocks {4:8.4f}s  ({5})'.format(
+                len(res[0][0]), res[0][1], res[0][2], res[1][1], res[1][2], path))
+    finally:
+        rarfile.USE_QUICK_OPEN = orig_quick_open
+
+
+class BlockHeaderDecrypt(rarfile.HeaderDecrypt):
+    """HeaderDecrypt.read formerly used by rarfile, one cipher call per 16-byte block."""
+
+    def read(self, cnt=None):
+        res = self.buf[self.pos:]
+        self.buf, self.pos = rarfile.EMPTY, 0
+        cnt -= len(res)
+        while cnt > 0:
+            enc = self.f.read(16)
+            if len(enc) < 16:
+                break
+            dec = self.ciph.decrypt(enc)
+            res += dec[:cnt]
+            self.buf = dec[cnt:]
+            cnt -= len(dec)
+        return res
+
+
+def bench_header_decrypt(sizes=(32, 256, 4096), count=2000, repeat=3):
+    """Time decrypting count headers of the given sizes laid out like an encrypted RAR5 archive."""
+
+    key = os.urandom(16)
+    for size in sizes:
+        padded = (size + 15) & ~15
+        data = b''.join(os.urandom(16 + padded) for _ in range(count))
+
+        def parse(cls):
+            # each header has its own IV, the padding is read with its last block
+            f = BytesIO(data)
+            res = []
+            for _ in range(count):
+                fd = cls(f, key, f.read(16))
+                head = fd.read(7)
+                res.append(head + fd.read(size - 7))
+            return res
+
+        assert parse(BlockHeaderDecrypt) == parse(rarfile.HeaderDecrypt)
+        block = min(timeit.repeat(lambda: parse(BlockHeaderDecrypt), number=1, repeat=repeat))
+        chunk = min(timeit.repeat(lambda: parse(rarfile.HeaderDecrypt), number=1, repeat=repeat))
+        print('headers {0:>5} x {1:>5} bytes: per block {2:8.4f}s  chunked {3:8.4f}s'.format(
+            count, size, block, chunk))
+
+
+def rar3_s2k_records(psw, salt):
+    """rarfile.rar3_s2k formerly used, one hash update per record."""
+
+    seed = psw.encode('utf-16le') + salt
+    iv = b''
+    h = rarfile.sha1()
+    for i in range(16):
+        for j in range(0x4000):
+            h.update(seed + rarfile.S_LONG.pack(i * 0x4000 + j)[:3])
+            if j == 0:
+                iv += h.digest()[19:20]
+    return rarfile.pack('<LLLL', *rarfile.unpack('>LLLL', h.digest()[:16])), iv
+
+
+def bench_s2k(passwords=(u'', u'password', u'correct horse battery staple' * 4), repeat=3):
+    """Time RAR3 key derivation per record and in bulk, without the key cache."""
+
+    salt = os.urandom(8)
+    for psw in passwords:
+        seed = psw.encode('utf-16le') + salt
+        assert rar3_s2k_records(psw, salt) == rarfile._rar3_s2k(seed)
+        records = min(timeit.repeat(lambda: rar3_s2k_records(psw, salt), number=1, repeat=repeat))
+        bulk = min(timeit.repeat(lambda: rarfile._rar3_s2k(seed), number=1, repeat=repeat))
+        print('rar3 s2k {0:>3} chars: per record {1:8.4f}s  bulk {2:8.4f}s'.format(len(psw), records, bulk))
+
+
+class LaneBlake2SP(rarfile.Blake2SP):
+    """Blake2SP.update formerly used by rarfile, one lane update per 64-byte block."""
+
+    __slots__ = []
+
+    def update(self, data):
+        view = memoryview(data)
+        bs = self.block_size
+        if self._buf:
+            need = bs - len(self._buf)
+            if len(view) < need:
+                self._buf += view.tobytes()
+                return
+            self._add_block(self._buf + view[:need].tobytes())
+            view = view[need:]
+        while len(view) >= bs:
+            self._add_block(view[:bs])
+            view = view[bs:]
+        self._buf = view.tobytes()
+
+
+def bench_blake2sp(sizes=(1000, 32 * 1024, 256 * 1024, 8 * 1024 * 1024), total=32 * 1024 * 1024, repeat=3):
+    """Time hashing total bytes fed in updates of the given sizes, per block and in bulk."""
+
+    if not rarfile._have_blake2:
+        print('blake2sp: blake2s missing')
+        return
+    data = os.urandom(total)
+
+    def hash_all(cls, size):
+        h = cls()
+        view = memoryview(data)
+        for pos in range(0, total, size):
+            h.update(view[pos:pos + size])
+        return h.digest()
+
+    for size in sizes:
+        expected = hash_all(LaneBlake2SP, size)
+        assert hash_all(rarfile.Blake2SP, size) == expected, 'blake2sp digests differ for {0}'.format(size)
+        block = min(timeit.repeat(lambda: hash_all(LaneBlake2SP, size), number=1, repeat=repeat))
+        bulk = min(timeit.repeat(lambda: hash_all(rarfile.Blake2SP, size), number=1, repeat=repeat))
+        print('blake2sp {0:>9} bytes per update: per block {1:8.4f}s  bulk {2:8.4f}s'.format(size, block, bulk))
+
+
+if __name__ == '__main__':
+    archives = [arg for arg in sys.argv[1:] if arg.lower().endswith('.rar')]
+    sizes = [int(arg) for arg in sys.argv[1:] if arg not in archives]
+    bench_results(*[tuple(sizes)] if sizes else ())
+    # the regex time grows exponentially with the item count here, keep the sizes small
+    bench_degraded()
+    # archives to decompress are given on the command line
+    bench_unpack(archives)
+    bench_read_many(archives)
+    bench_listing(archives)
+    check_stream(archives)
+    check_filtered_links(archives)
+    check_archive_store(archives)
+    bench_info_memory(archives)
+    bench_quick_open(archives)
+    bench_header_decrypt()
+    bench_s2k()
+    bench_blake2sp()
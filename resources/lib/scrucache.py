@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Persistent caches kept in the addon profile directory.
+"""
+
+
+import os
+import sqlite3
+import struct
+import time
+from contextlib import closing
+from hashlib import sha1, sha256
+from tempfile import mkstemp
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class SCRuFileLock:
+    """Exclusive lock on a file, held across plugin invocations.
+
+    The lock is taken on a separate .lock file next to the protected one.
+    """
+
+    def __init__(self, path):
+        """Constructor.
+
+        :param path: Path of the protected file
+        :type path: unicode
+        """
+
+        self.path = path + '.lock'
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+')
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class SCRuCache:
+    """SQLite backed cache shared by concurrent plugin invocations.
+
+    Every operation uses its own short-lived connection, so instances can be used from any thread,
+    and SQLite's file locking serializes writers from different processes.
+    """
+
+    _schema = ()
+
+    def __init__(self, path, timeout=10):
+        """Constructor.
+
+        :param path: Database file path
+        :type path: unicode
+        :param timeout: Seconds to wait for a lock held by another invocation
+        :type timeout: int
+        """
+
+        self.path = path
+        self._timeout = timeout
+        self._ready = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None)
+        if not self._ready:
+            for statement in self._schema:
+                connection.execute(statement)
+            self._ready = True
+        return closing(connection)
+
+    @staticmethod
+    def _now():
+        return time.time()
+
+
+class SCRuSearchCache(SCRuCache):
+    """Search results keyed by (title, year).
+
+    Holds the download page URL and HTML. Entries expire after ttl seconds, and the least recently used
+    ones are evicted when the total page size grows over max_bytes.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS search ('
+        ' title TEXT NOT NULL,'
+        ' year TEXT NOT NULL,'
+        ' url TEXT NOT NULL,'
+        ' page TEXT NOT NULL,'
+        ' size INTEGER NOT NULL,'
+        ' created REAL NOT NULL,'
+        ' accessed REAL NOT NULL,'
+        ' PRIMARY KEY (title, year))',
+        'CREATE INDEX IF NOT EXISTS search_accessed ON search (accessed)',
+    )
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_bytes=8 * 1024 * 1024, timeout=10):
+        """Constructor.
+
+        :param path: Database file path
+        :type path: unicode
+        :param ttl: Entry lifetime in seconds
+        :type ttl: int
+        :param max_bytes: Maximum total size of the cached pages
+        :type max_bytes: int
+        :param timeout: Seconds to wait for a lock held by another invocation
+        :type timeout: int
+        """
+
+        SCRuCache.__init__(self, path, timeout)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, title, year):
+        """Look up a search result.
+
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: unicode
+        :return: Download page HTML and URL, or None when not cached
+        :rtype: (unicode, unicode)
+        """
+
+        key = self._key(title, year)
+        now = self._now()
+        with self._connect() as db:
+            row = db.execute('SELECT page, url, created FROM search WHERE title = ? AND year = ?', key).fetchone()
+            if row is None:
+                return None
+            if row[2] + self.ttl <= now:
+                db.execute('DELETE FROM search WHERE title = ? AND year = ?', key)
+                return None
+            db.execute('UPDATE search SET accessed = ? WHERE title = ? AND year = ?', (now,) + key)
+        return row[0], row[1]
+
+    def put(self, title, year, page, url):
+        """Store a search result.
+
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: unicode
+        :param page: Download page HTML
+        :type page: unicode
+        :param url: Download page URL
+        :type url: unicode
+        """
+
+        size = len(page.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        now = self._now()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute('INSERT OR REPLACE INTO search VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           self._key(title, year) + (url, page, size, now, now))
+                db.execute('DELETE FROM search WHERE created + ? <= ?', (self.ttl, now))
+                self._evict(db)
+                db.execute('COMMIT')
+            except:
+                db.execute('ROLLBACK')
+                raise
+
+    def _evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM search').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for title, year, size in db.execute('SELECT title, year, size FROM search ORDER BY accessed').fetchall():
+            db.execute('DELETE FROM search WHERE title = ? AND year = ?', (title, year))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _key(title, year):
+        return title.strip().lower(), unicode(year).strip()
+
+
+class SCRuNegativeCache(SCRuCache):
+    """Searches that found nothing, keyed by a 64-bit hash of (title, year).
+
+    Only the hash and the time of the failed search are kept. Entries expire after ttl seconds,
+    which is kept shorter than the search cache lifetime so that newly added subtitles are picked up.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS misses ('
+        ' key INTEGER PRIMARY KEY,'
+        ' created REAL NOT NULL)',
+    )
+
+    def __init__(self, path, ttl=6 * 60 * 60, timeout=10):
+        """Constructor.
+
+        :param path: Database file path
+        :type path: unicode
+        :param ttl: Entry lifetime in seconds
+        :type ttl: int
+        :param timeout: Seconds to wait for a lock held by another invocation
+        :type timeout: int
+        """
+
+        SCRuCache.__init__(self, path, timeout)
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, title, year):
+        """Check whether a search is known to find nothing.
+
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: unicode
+        :return: True when a recent search for the movie found nothing
+        :rtype: bool
+        """
+
+        with self._connect() as db:
+            row = db.execute('SELECT created FROM misses WHERE key = ?', (self._key(title, year),)).fetchone()
+        found = row is not None and row[0] + self.ttl > self._now()
+        self.stats['hits' if found else 'misses'] += 1
+        return found
+
+    def put(self, title, year):
+        """Remember that a search found nothing.
+
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: unicode
+        """
+
+        now = self._now()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute('INSERT OR REPLACE INTO misses VALUES (?, ?)', (self._key(title, year), now))
+                db.execute('DELETE FROM misses WHERE created + ? <= ?', (self.ttl, now))
+                db.execute('COMMIT')
+            except:
+                db.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _key(title, year):
+        title, year = SCRuSearchCache._key(title, year)
+        digest = sha1(u'{0}\0{1}'.format(title, year).encode('utf-8')).digest()
+        return struct.unpack('<q', digest[:8])[0]
+
+
+class SCRuArchiveStore(SCRuCache):
+    """Content-addressed store for downloaded subtitle archives.
+
+    Archives are saved under their SHA-256 digest and looked up by download URI.
+    The digest is verified on every read, so a damaged file is treated as a miss.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS archives ('
+        ' uri TEXT PRIMARY KEY,'
+        ' digest TEXT NOT NULL,'
+        ' size INTEGER NOT NULL,'
+        ' created REAL NOT NULL,'
+        ' accessed REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS archives_accessed ON archives (accessed)',
+    )
+
+    def __init__(self, directory, ttl=7 * 24 * 60 * 60, max_bytes=32 * 1024 * 1024, timeout=10):
+        """Constructor.
+
+        :param directory: Store directory, created when missing
+        :type directory: unicode
+        :param ttl: Archive lifetime in seconds
+        :type ttl: int
+        :param max_bytes: Maximum total size of the stored archives
+        :type max_bytes: int
+        :param timeout: Seconds to wait for a lock held by another invocation
+        :type timeout: int
+        """
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        SCRuCache.__init__(self, os.path.join(directory, 'index.db'), timeout)
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, uri):
+        """Get a stored archive.
+
+        :param uri: Archive download URI
+        :type uri: unicode
+        :return: Archive content, or None when not stored
+        :rtype: str
+        """
+
+        uri = self._key(uri)
+        now = self._now()
+        with self._connect() as db:
+            row = db.execute('SELECT digest, created FROM archives WHERE uri = ?', (uri,)).fetchone()
+            if row is None:
+                return None
+
+            digest = row[0]
+            data = None
+            if row[1] + self.ttl > now:
+                try:
+                    with open(self._path(digest), 'rb') as f:
+                        data = f.read()
+                except IOError:
+                    pass
+
+            if data is None or sha256(data).hexdigest() != digest:
+                db.execute('DELETE FROM archives WHERE uri = ?', (uri,))
+                self._remove_unreferenced(db, digest)
+                return None
+
+            db.execute('UPDATE archives SET accessed = ? WHERE uri = ?', (now, uri))
+        return data
+
+    def put(self, uri, data):
+        """Store an archive.
+
+        :param uri: Archive download URI
+        :type uri: unicode
+        :param data: Archive content
+        :type data: str
+        """
+
+        if len(data) > self.max_bytes:
+            return
+
+        digest = sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            # write under a unique name first so readers never see a partial file
+            fd, temp_path = mkstemp(dir=self.directory, suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # another invocation stored the same content meanwhile
+                os.remove(temp_path)
+
+        now = self._now()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute('INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?)',
+                           (self._key(uri), digest, len(data), now, now))
+                for expired in db.execute('SELECT uri, digest FROM archives WHERE created + ? <= ?',
+                                          (self.ttl, now)).fetchall():
+                    db.execute('DELETE FROM archives WHERE uri = ?', (expired[0],))
+                    self._remove_unreferenced(db, expired[1])
+                self._evict(db)
+                db.execute('COMMIT')
+            except:
+                db.execute('ROLLBACK')
+                raise
+
+    def _evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM archives').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for uri, digest, size in db.execute('SELECT uri, digest, size FROM archives ORDER BY accessed').fetchall():
+            db.execute('DELETE FROM archives WHERE uri = ?', (uri,))
+            self._remove_unreferenced(db, digest)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _remove_unreferenced(self, db, digest):
+        if db.execute('SELECT 1 FROM archives WHERE digest = ?', (digest,)).fetchone():
+            return
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + '.rar')
+
+    @staticmethod
+    def _key(uri):
+        return uri if isinstance(uri, unicode) else uri.decode('utf-8')
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Extractors for subs.com.ru page markup.
+"""
+
+
+import re
+from difflib import SequenceMatcher
+from HTMLParser import HTMLParser
+
+
+class SCRuResultScanner:
+    """Extract subtitle records from a result page in one linear pass over its tags.
+
+    Each record is a dict with the keys rating (high-rating, low-rating or None), page_url, language
+    and verified.
+    """
+
+    # only the tags carrying result data are visited, everything else is skipped by the regex engine
+    _tag = re.compile(r'<(/?)(li|a|span)(?=[\s/>])([^>]*)>', re.IGNORECASE)
+    _attribute = re.compile(r'([a-zA-Z][a-zA-Z0-9-]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+    def __init__(self):
+        self.records = []
+        """:type: list of dict of [str, unicode|bool]"""
+
+        self._record = None
+        self._anchor = False
+        self._span_depth = 0
+        self._language_depth = None
+        self._language = []
+
+    @classmethod
+    def scan(cls, page):
+        """Extract all records from a page.
+
+        :param page: Result page HTML
+        :type page: unicode
+        :return: Subtitle records
+        :rtype: list of dict of [str, unicode|bool]
+        """
+
+        scanner = cls()
+        pos = 0
+        for match in cls._tag.finditer(page):
+            if scanner._language_depth is not None:
+                scanner._language.append(page[pos:match.start()])
+            scanner._handle_tag(match.group(1) == u'/', match.group(2).lower(), match.group(3))
+            pos = match.end()
+        return scanner.records
+
+    def _handle_tag(self, closing, name, attributes):
+        if name == u'li':
+            if closing:
+                self._end_record()
+            elif u'data-id' in attributes:
+                self._end_record()
+                rating = self._attributes(attributes).get(u'class')
+                self._record = {
+                    'rating': rating if rating in (u'high-rating', u'low-rating') else None,
+                    'page_url': None,
+                    'language': None,
+                    'verified': False,
+                }
+            return
+
+        if self._record is None:
+            return
+
+        if name == u'a':
+            if closing:
+                self._anchor = False
+            elif self._record['page_url'] is None:
+                values = self._attributes(attributes)
+                if values.get(u'class') == u'subtitle-page':
+                    self._record['page_url'] = values.get(u'href')
+                    self._anchor = True
+                    self._span_depth = 0
+        elif name == u'span' and self._anchor:
+            if closing:
+                self._span_depth -= 1
+                if self._span_depth == self._language_depth:
+                    self._record['language'] = u''.join(self._language).strip()
+                    self._language_depth = None
+            else:
+                values = self._attributes(attributes) if attributes.strip() else {}
+                if not values and self._record['language'] is None and self._language_depth is None:
+                    # the first plain span of the link holds the language name
+                    self._language_depth = self._span_depth
+                    self._language = []
+                elif values.get(u'class') == u'verified-subtitle':
+                    self._record['verified'] = True
+                self._span_depth += 1
+
+    def _end_record(self):
+        if self._record is not None and self._record['page_url'] is not None:
+            self.records.append(self._record)
+        self._record = None
+        self._anchor = False
+        self._language_depth = None
+
+    def _attributes(self, attributes):
+        return dict((m.group(1).lower(), m.group(2) if m.group(2) is not None else m.group(3))
+                    for m in self._attribute.finditer(attributes))
+
+
+class SCRuSearchIndex:
+    """Candidates of a search results page, indexed by year of release.
+
+    Every candidate is a dict with the keys id, url (relative download page URL), title, date and year.
+    """
+
+    _link = re.compile(r'a href="(page\.php\?id=([0-9]*))&[^"]*"[^>]*>', re.UNICODE)
+    _date = re.compile(r'[0-9]{2}/[0-9]{2}/([0-9]{4})', re.UNICODE)
+    _markup = re.compile(r'<[^>]*>')
+
+    def __init__(self, page):
+        """Constructor.
+
+        :param page: Film search results page
+        :type page: unicode
+        """
+
+        self.candidates = []
+        """:type: list of dict of [str, unicode|int]"""
+
+        self._years = {}
+        self._parse(page)
+
+    def _parse(self, page):
+        seen = set()
+        for link in self._link.finditer(page):
+            if link.group(2) in seen:
+                continue
+
+            # the release date is printed within the two lines following the link
+            end = link.end() - 1
+            for _ in range(3):
+                end = page.find(u'\n', end + 1)
+                if end < 0:
+                    end = len(page)
+                    break
+            date = self._date.search(page, link.end(), end)
+            if not date:
+                continue
+
+            title_end = page.find(u'</a>', link.end(), end)
+            title = page[link.end():title_end] if title_end >= 0 else u''
+            candidate = {
+                'id': link.group(2),
+                'url': link.group(1),
+                'title': _unescape(self._markup.sub(u'', title)).strip(),
+                'date': date.group(0),
+                'year': int(date.group(1)),
+            }
+            seen.add(candidate['id'])
+            self.candidates.append(candidate)
+            self._years.setdefault(candidate['year'], []).append(candidate)
+
+    def lookup(self, title, year, tolerance=1):
+        """Find the candidates best matching a movie.
+
+        Candidates released up to tolerance years off are included, ranked below exact year matches
+        with the same title similarity.
+
+        :param title: Movie title
+        :type title: unicode
+        :param year: Year of release
+        :type year: int | unicode
+        :param tolerance: Accepted difference in years
+        :type tolerance: int
+        :return: Candidates, best first
+        :rtype: list of dict of [str, unicode|int]
+        """
+
+        try:
+            year = int(year)
+        except ValueError:
+            return []
+        wanted = _normalize(title)
+        ranked = []
+        for offset in range(-tolerance, tolerance + 1):
+            for candidate in self._years.get(year + offset, ()):
+                similarity = SequenceMatcher(None, wanted, _normalize(candidate['title'])).ratio()
+                ranked.append((similarity * (1 - 0.1 * abs(offset)), candidate))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [candidate for _, candidate in ranked]
+
+
+def _normalize(title):
+    return u' '.join(re.sub(r'[^\w]+', u' ', title.lower(), flags=re.UNICODE).split())
+
+
+def _unescape(text):
+    return HTMLParser().unescape(text) if u'&' in text else text
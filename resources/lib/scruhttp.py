@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Shared HTTP session with persistent keep-alive connections.
+"""
+
+
+import httplib
+import os
+import socket
+import threading
+import time
+import urllib2
+import cookielib
+from contextlib import closing
+from scrucache import SCRuFileLock
+
+
+class SCRuConnectionPool:
+    """Pool of persistent HTTP connections, grouped by host."""
+
+    def __init__(self, max_per_host=4, timeout=30):
+        """Constructor.
+
+        :param max_per_host: Maximum number of simultaneously open connections per host
+        :type max_per_host: int
+        :param timeout: Socket timeout in seconds, also the longest wait for a free connection slot
+        :type timeout: int
+        """
+
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+
+        self.stats = {
+            'requests': 0,
+            'connects': 0,
+            'reuses': 0,
+            'retries': 0,
+        }
+        """:type: dict of [str, int]"""
+
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._idle = {}
+        self._busy = {}
+
+    def acquire(self, scheme, host):
+        """Get a connection to a host, reusing an idle one when possible.
+
+        Blocks while the host already has max_per_host connections checked out.
+
+        :param scheme: URL scheme, http or https
+        :type scheme: str
+        :param host: Host name, optionally with port
+        :type host: str
+        :return: Connection and whether it was reused
+        :rtype: (httplib.HTTPConnection, bool)
+        :raises urllib2.URLError: No connection slot was freed within the timeout
+        """
+
+        key = (scheme, host)
+        deadline = time.time() + self.timeout
+
+        with self._lock:
+            while self._busy.get(key, 0) >= self.max_per_host:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise urllib2.URLError('timed out waiting for a connection to {0}'.format(host))
+                self._slot_freed.wait(remaining)
+            self._busy[key] = self._busy.get(key, 0) + 1
+
+            self.stats['requests'] += 1
+            idle = self._idle.get(key)
+            if idle:
+                self.stats['reuses'] += 1
+                return idle.pop(), True
+            self.stats['connects'] += 1
+
+        return self.connect(scheme, host), False
+
+    def connect(self, scheme, host):
+        """Open a new connection to a host, outside of the slot accounting.
+
+        :param scheme: URL scheme, http or https
+        :type scheme: str
+        :param host: Host name, optionally with port
+        :type host: str
+        :rtype: httplib.HTTPConnection
+        """
+
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, timeout=self.timeout)
+        return httplib.HTTPConnection(host, timeout=self.timeout)
+
+    def release(self, scheme, host, connection, reusable):
+        """Return a connection to the pool.
+
+        :param scheme: URL scheme, http or https
+        :type scheme: str
+        :param host: Host name, optionally with port
+        :type host: str
+        :param connection: Connection obtained from acquire()
+        :type connection: httplib.HTTPConnection
+        :param reusable: Whether the connection can serve another request
+        :type reusable: bool
+        """
+
+        key = (scheme, host)
+        if not reusable:
+            connection.close()
+
+        with self._lock:
+            if reusable:
+                self._idle.setdefault(key, []).append(connection)
+            self._busy[key] -= 1
+            self._slot_freed.notify()
+
+    def count_retry(self):
+        """Account for a request retried on a fresh connection."""
+
+        with self._lock:
+            self.stats['retries'] += 1
+            self.stats['connects'] += 1
+
+    def close(self):
+        """Close all idle connections."""
+
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+
+class SCRuPooledResponse:
+    """File-like HTTP response that hands its connection back to the pool once read."""
+
+    def __init__(self, pool, scheme, host, connection, response, url):
+        self._pool = pool
+        self._scheme = scheme
+        self._host = host
+        self._connection = connection
+        self._response = response
+        self._url = url
+        self._buffer = ''
+
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+
+    def info(self):
+        """Response headers.
+
+        :rtype: httplib.HTTPMessage
+        """
+
+        return self._response.msg
+
+    def geturl(self):
+        """URL of the resource retrieved, after redirects.
+
+        :rtype: str
+        """
+
+        return self._url
+
+    def getcode(self):
+        """HTTP status code.
+
+        :rtype: int
+        """
+
+        return self.code
+
+    def read(self, amt=None):
+        """Read from the response body.
+
+        :param amt: Number of bytes to read, or None for the whole remaining body
+        :type amt: int
+        :rtype: str
+        """
+
+        data, self._buffer = self._buffer, ''
+        if amt is None:
+            data += self._response.read()
+        elif amt > len(data):
+            data += self._response.read(amt - len(data))
+        else:
+            data, self._buffer = data[:amt], data[amt:]
+
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def readline(self, limit=-1):
+        """Read a single line from the response body.
+
+        :rtype: str
+        """
+
+        while '\n' not in self._buffer and not self._response.isclosed():
+            chunk = self._response.read(1024)
+            if not chunk:
+                break
+            self._buffer += chunk
+
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        if 0 <= limit < end:
+            end = limit
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+
+        if self._response.isclosed():
+            self._release()
+        return line
+
+    def readlines(self):
+        """Read all remaining lines.
+
+        :rtype: list of str
+        """
+
+        return self.read().splitlines(True)
+
+    def close(self):
+        """Close the response.
+
+        The connection is kept alive only if the body has been read completely.
+        """
+
+        if self._connection is not None and not self._response.isclosed():
+            self._response.close()
+            self._release(reusable=False)
+        self._release()
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def __del__(self):
+        # a response dropped unread, e.g. inside an HTTPError nobody closed, must not keep its slot
+        self.close()
+
+    def buffer_body(self):
+        """Read the rest of the body into memory and hand the connection back to the pool."""
+
+        if self._connection is not None:
+            self._buffer += self._response.read()
+            self._release()
+
+    def _release(self, reusable=True):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        self._pool.release(self._scheme, self._host, connection, reusable and not self._response.will_close)
+
+
+class SCRuKeepAliveHandler(urllib2.HTTPHandler):
+    """urllib2 handler that sends HTTP and HTTPS requests over pooled persistent connections."""
+
+    # ahead of the default HTTPSHandler, which build_opener still adds
+    handler_order = urllib2.HTTPHandler.handler_order - 1
+
+    def __init__(self, pool):
+        """Constructor.
+
+        :param pool: Connection pool
+        :type pool: SCRuConnectionPool
+        """
+
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open('http', req)
+
+    def https_open(self, req):
+        return self._open('https', req)
+
+    https_request = urllib2.AbstractHTTPHandler.do_request_
+
+    def _open(self, scheme, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        connection, reused = self.pool.acquire(scheme, host)
+        try:
+            try:
+                response = self._request(connection, req, headers)
+            except (socket.error, httplib.HTTPException):
+                if not reused:
+                    raise
+                # the server dropped the idle connection, try once more on a fresh one
+                connection.close()
+                connection = self.pool.connect(scheme, host)
+                self.pool.count_retry()
+                response = self._request(connection, req, headers)
+        except socket.error as err:
+            self.pool.release(scheme, host, connection, False)
+            raise urllib2.URLError(err)
+        except:
+            self.pool.release(scheme, host, connection, False)
+            raise
+
+        pooled = SCRuPooledResponse(self.pool, scheme, host, connection, response, req.get_full_url())
+        if response.status >= 400:
+            # urllib2 raises HTTPError around an error response, callers never get to close it
+            pooled.buffer_body()
+        return pooled
+
+    @staticmethod
+    def _request(connection, req, headers):
+        connection.request(req.get_method(), req.get_selector(), req.data, headers)
+        return connection.getresponse(buffering=True)
+
+
+class SCRuRangedFile:
+    """Seekable read-only file over HTTP.
+
+    Data is fetched with Range requests in block_size blocks and cached, so reading the headers of an
+    archive only transfers the blocks holding them. When the server ignores the Range header the whole
+    body is downloaded once and served from memory.
+    """
+
+    block_size = 8 * 1024
+
+    def __init__(self, session, url, block_size=None, response=None):
+        """Constructor.
+
+        :param session: HTTP session
+        :type session: SCRuHTTPSession
+        :param url: URL of the file
+        :type url: str
+        :param block_size: Size of the blocks requested from the server, the class default when None
+        :type block_size: int
+        :param response: Already open response to a request for the first block, used instead of a new request
+        :type response: SCRuPooledResponse
+        """
+
+        self.session = session
+        self.url = url
+        if block_size:
+            self.block_size = block_size
+
+        self.size = None
+        """:type: int"""
+
+        self.ranged = True
+        """False when the server ignored the Range header and the whole file was downloaded.
+
+        :type: bool
+        """
+
+        self.requests = 0
+        """:type: int"""
+
+        self._blocks = {}
+        self._pos = 0
+
+        if response is not None:
+            self._accept(response, 0)
+
+    def complete(self):
+        """Whether the whole file has been fetched.
+
+        :rtype: bool
+        """
+
+        return self.size is not None and len(self._blocks) * self.block_size >= self.size
+
+    def getvalue(self):
+        """Whole file content, fetching the missing blocks.
+
+        :rtype: str
+        """
+
+        self._ensure_size()
+        self._fetch(0, self.size)
+        return self._slice(0, self.size)
+
+    def read(self, n=-1):
+        """Read bytes from the current position.
+
+        :param n: Number of bytes, or negative for the rest of the file
+        :type n: int
+        :rtype: str
+        """
+
+        self._ensure_size()
+        if n is None or n < 0:
+            end = self.size
+        else:
+            end = min(self._pos + n, self.size)
+        if end <= self._pos:
+            return ''
+
+        self._fetch(self._pos, end)
+        data = self._slice(self._pos, end)
+        self._pos = end
+        return data
+
+    def readinto(self, buf):
+        """Read bytes into a buffer.
+
+        :rtype: int
+        """
+
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        """Change the current position.
+
+        :rtype: int
+        """
+
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            self._ensure_size()
+            offset += self.size
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        """Current position.
+
+        :rtype: int
+        """
+
+        return self._pos
+
+    def close(self):
+        """Drop the cached blocks."""
+
+        self._blocks = {}
+
+    def _ensure_size(self):
+        if self.size is None:
+            self._request(0, self.block_size)
+
+    def _fetch(self, start, end):
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+        index = first
+        while index <= last:
+            if index in self._blocks:
+                index += 1
+                continue
+            # coalesce a run of missing blocks into a single request
+            run = index
+            while run + 1 <= last and run + 1 not in self._blocks:
+                run += 1
+            self._request(index * self.block_size, min((run + 1) * self.block_size, self.size))
+            index = run + 1
+
+    def _request(self, start, end):
+        with closing(self.session.open(self.url, range_header(start, end))) as response:
+            self._accept(response, start)
+
+    def _accept(self, response, start):
+        self.requests += 1
+        data = response.read()
+
+        content_range = response.info().getheader('Content-Range') if response.getcode() == 206 else None
+        if content_range:
+            # bytes first-last/total
+            first, total = content_range.split(' ')[-1].split('/')
+            start = int(first.split('-')[0])
+            self.size = int(total)
+        else:
+            start = 0
+            self.size = len(data)
+            self.ranged = False
+
+        for offset in range(0, len(data), self.block_size):
+            index = (start + offset) // self.block_size
+            self._blocks[index] = data[offset:offset + self.block_size]
+
+    def _slice(self, start, end):
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+        data = ''.join(self._blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset]
+
+
+class SCRuHTTPSession:
+    """HTTP session shared by the SCRu classes.
+
+    Keeps connections alive between requests and holds the session cookies.
+    """
+
+    def __init__(self, max_per_host=4, timeout=30):
+        """Constructor.
+
+        :param max_per_host: Maximum number of simultaneously open connections per host
+        :type max_per_host: int
+        :param timeout: Socket timeout in seconds
+        :type timeout: int
+        """
+
+        self.cookies = cookielib.LWPCookieJar()
+        """:type: cookielib.LWPCookieJar"""
+
+        self.pool = SCRuConnectionPool(max_per_host, timeout)
+        """:type: SCRuConnectionPool"""
+
+        self._cookie_path = None
+        self._session_ttl = 0
+
+        self._opener = urllib2.build_opener(
+            SCRuKeepAliveHandler(self.pool),
+            urllib2.HTTPCookieProcessor(self.cookies)
+        )
+
+    def open(self, url, headers=None):
+        """Open a URL.
+
+        :param url: URL
+        :type url: unicode
+        :param headers: Extra request headers
+        :type headers: dict of [str, str]
+        :return: Response, to be closed by the caller
+        :rtype: SCRuPooledResponse
+        """
+
+        req = urllib2.Request(url.encode('utf-8') if isinstance(url, unicode) else url)
+        for name, value in (headers or {}).items():
+            req.add_header(name, value)
+        return self._opener.open(req)
+
+    def load_cookies(self, path, session_ttl=20 * 60):
+        """Load cookies saved by a previous plugin invocation.
+
+        Expired cookies are dropped. Cookies set for the browser session only are kept for session_ttl
+        seconds after they were last saved, which is shorter than the server side PHP session lifetime.
+
+        :param path: Cookie file path, also used by save_cookies()
+        :type path: unicode
+        :param session_ttl: Lifetime of session cookies in seconds
+        :type session_ttl: int
+        """
+
+        self._cookie_path = path
+        self._session_ttl = session_ttl
+
+        if not os.path.exists(path):
+            return
+        with SCRuFileLock(path):
+            try:
+                self.cookies.load(path, ignore_discard=True)
+            except (IOError, cookielib.LoadError):
+                self.cookies.clear()
+
+    def save_cookies(self):
+        """Save cookies to the file given to load_cookies()."""
+
+        if not self._cookie_path:
+            return
+
+        expires = int(time.time()) + self._session_ttl
+        for cookie in self.cookies:
+            if cookie.discard:
+                cookie.expires = expires
+
+        with SCRuFileLock(self._cookie_path):
+            self.cookies.save(self._cookie_path, ignore_discard=True)
+
+    def close(self):
+        """Close all idle connections."""
+
+        self.pool.close()
+
+
+def range_header(start, end):
+    """Build a Range request header.
+
+    :param start: First byte offset
+    :type start: int
+    :param end: Offset past the last byte
+    :type end: int
+    :rtype: dict of [str, str]
+    """
+
+    return {'Range': 'bytes={0}-{1}'.format(start, end - 1)}
+
+
+_session = None
+
+
+def get_session():
+    """Get the process-wide HTTP session.
+
+    :rtype: SCRuHTTPSession
+    """
+
+    global _session
+    if _session is None:
+        _session = SCRuHTTPSession()
+    return _session
@@ -10,11 +10,10 @@ from StringIO import StringIO
 from io import BytesIO
 from abc import abstractmethod, ABCMeta
 from contextlib import closing
-from urllib2 import urlopen
-from urllib2 import Request
-import cookielib
 import urllib2
-from rarfile import RarFile
+from rarfile import RarFile, SpoolFile
+from scruhtml import SCRuResultScanner
+from scruhttp import SCRuRangedFile, get_session, range_header
 import re
 import os
 
@@ -104,21 +103,17 @@ class SCRuSubtitles:
 
         self._download_param = u'&a=dl'
 
-        self.cookies = cookielib.LWPCookieJar()
-        self.handlers = [
-            urllib2.HTTPHandler(),
-            urllib2.HTTPSHandler(),
-            urllib2.HTTPCookieProcessor(self.cookies)
-            ]
-        self.opener = urllib2.build_opener(*self.handlers)
+        self.session = get_session()
+        """:type: SCRuHTTPSession"""
 
+        self.archives = None
+        """:type: SCRuArchiveStore"""
 
-    def fetch(self, uri):
-        req = urllib2.Request(uri)
-        return self.opener.open(req)
+    def fetch(self, uri, headers=None):
+        return self.session.open(uri, headers)
 
     def getcookie(self):
-        for cookie in self.cookies:
+        for cookie in self.session.cookies:
             if 'PHPSESSID' in cookie.name:
                 return cookie.value
 
@@ -146,17 +141,38 @@ class SCRuSubtitles:
         path = os.path.join(self.workdir, os.path.basename(filename))
 
         # self.logger.debug(u'Downloading subtitle archive from {0}'.format(referer + self._download_param))
-        self.logger.debug(u'Downloading URL: {0}'.format( urllib2.unquote(url) ) )
+        download_uri = urllib2.unquote(url)
+        data = self.archives.get(download_uri) if self.archives else None
+        if data is None:
+            self.logger.debug(u'Downloading URL: {0}'.format(download_uri))
+            with closing(SpoolFile(self.session.open(download_uri))) as content:
+                # headers are parsed and the member extracted while the rest of the archive is still arriving
+                self._extract(content, filename, path)
+                if self.archives:
+                    self.archives.put(download_uri, content.getvalue())
+        else:
+            self.logger.debug(u'Archive for {0} found in store'.format(download_uri))
+            self._extract(StringIO(data), filename, path)
 
-        with closing(urlopen( urllib2.unquote(url) )) as f:
-            content = StringIO(f.read())
+        self.listener.on_subtitle_downloaded(path)
+
+    def _extract(self, content, filename, path):
+        """Extract a subtitle from an archive.
+
+        :param content: RAR archive
+        :type content: file
+        :param filename: Path to subtitle file within the archive
+        :type filename: unicode
+        :param path: Destination path
+        :type path: unicode
+        """
 
         self.logger.debug(u'Extracting subtitle to {0}'.format(path))
-        with RarFile(content) as z, closing(open(path.encode('utf-8'), mode='wb')) as f:
+        # a spooled download is parsed while it arrives, a stored archive is already complete
+        stream = isinstance(content, SpoolFile)
+        with RarFile(content, stream=stream) as z, closing(open(path.encode('utf-8'), mode='wb')) as f:
             f.write(z.read(filename).decode('windows-1251').encode('utf-8'))
 
-        self.listener.on_subtitle_downloaded(path)
-
     def search(self, page, referer, languages):
         """Get subtitle download.
 
@@ -192,7 +208,7 @@ class SCRuSubtitles:
         url = '{0}{1}'.format(self._base_url, link)
         self.logger.debug('Fetching subtitle page from {0}'.format(url))
 
-        with closing(urlopen(url)) as page:
+        with closing(self.session.open(url)) as page:
             encoding = page.info().getparam('charset')
             return unicode(page.read(), encoding)
 
@@ -205,22 +221,10 @@ class SCRuSubtitles:
         :type languages: list of unicode
         """
 
-        pattern = re.compile(r'<li data-id=".*?"(?: class="((?:high|low)-rating)")?>\s*'
-                             r'<span class="rating">\s*(?:<span.*?>.*?</span>\s*)*</span>\s*'
-                             r'<a class="subtitle-page" href="(.*?)">\s*'
-                             r'<span class="flag flag-.*?">.*?</span>\s*'
-                             r'<span>(.*?)</span>.*?'
-                             r'<span class="subdesc">.*?</span>\s*'
-                             r'(?:<span class="verified-subtitle" title="verified">.*?</span>\s*)?'
-                             r'</a>'
-                             r'.*?'
-                             r'</li>',
-                             re.UNICODE)
-
-        for match in pattern.findall(page):
-            language = self._get_subtitle_language(unicode(match[2]))
-            page_url = unicode(match[1])
-            # rating = self._get_subtitle_rating(unicode(match[0]))
+        for record in SCRuResultScanner.scan(page):
+            language = self._get_subtitle_language(record['language'])
+            page_url = record['page_url']
+            # rating = self._get_subtitle_rating(record['rating'])
 
             if language in languages:
                 page = self._fetch_subtitle_page(page_url)
@@ -242,43 +246,102 @@ class SCRuSubtitles:
         :type archive: dict of [str, unicode]
         """
 
+        self._report_subtitles(self._collect_archive_subtitles(archive))
+
+    def _report_subtitles(self, subtitles):
+        """Pass found subtitles to the listener.
+
+        :param subtitles: Subtitles found
+        :type subtitles: list of dict of [str, unicode]
+        """
+
+        for subtitle in subtitles:
+            self.logger.debug(u'Found 1 subtitle at {0}: {1}'.format(subtitle['referer'], subtitle['filename']))
+            self.listener.on_subtitle_found(subtitle)
+
+    def _collect_archive_subtitles(self, archive):
+        """Collect subtitles from a RAR archive.
+
+        The listener is not called.
+
+        :param archive: RAR archive URL
+        :type archive: dict of [str, unicode]
+        :return: Subtitles found
+        :rtype: list of dict of [str, unicode]
+        """
+
         self.logger.debug(u'Got referer URL: {0}'.format( archive['referer'] ))
         referer = archive['referer'] + self._download_param
 
-        response = self.fetch(referer)
-        cookie = self.getcookie()
-        #self.logger.debug(u'Got session cookie: {0}'.format(cookie))
-        req = Request(archive['referer'] + self._download_param)
-        req.add_header('Cookie', 'PHPSESSID=' +cookie)
-        #self.logger.debug(u'Got URL: {0}'.format(archive['referer'] + self._download_param ))
-        # parse URL a second time with cookie to get download link
-        response = self.fetch( referer )
-        # response.geturl() #download link
+        download_uri, content = self._fetch_archive(referer)
+        if download_uri is None:
+            # no valid session cookie yet; that request obtained one, so ask a second time
+            self.logger.debug(u'Got session cookie: {0}'.format(self.getcookie()))
+            download_uri, content = self._fetch_archive(referer)
+        if download_uri is None:
+            self.logger.warn(u'No archive behind {0}'.format(referer))
+            return []
+
+        #self.logger.debug(u'Got archive: {0}')
+
+        with closing(content):
+            # ranged: only the blocks holding the RAR headers are fetched,
+            # streamed: entries are listed as soon as their headers arrive
+            # other entries are skipped while the headers are parsed
+            with RarFile(content, stream=True, member_filter=self._is_subtitle_file) as f:
+                filenames = [info.filename for info in f.iterinfo()]
+
+            if isinstance(content, SCRuRangedFile):
+                self.logger.debug(u'Listed archive {0} with {1} request(s)'.format(download_uri, content.requests))
+            if self.archives and (isinstance(content, SpoolFile) or content.complete()):
+                self.archives.put(download_uri, content.getvalue())
+
+        return [{
+            'filename': filename,
+            # 'language': archive['language'],
+            # 'rating': archive['rating'],
+            'url': archive['url'],
+            'referer': archive['referer'],
+            'download_uri': download_uri
+        } for filename in filenames]
+
+    def _fetch_archive(self, referer):
+        """Follow the download link to the archive.
+
+        The site only redirects to the archive when the request carries a valid PHPSESSID cookie.
+
+        :param referer: Download link
+        :type referer: unicode
+        :return: Archive URI and archive file, or (None, None) when the request was not redirected
+        :rtype: (str, SCRuRangedFile | SpoolFile)
+        """
 
+        # the Range header survives the redirect, so the archive response only carries its first block
+        response = self.fetch(referer, range_header(0, SCRuRangedFile.block_size))
         download_uri = response.geturl()
-        response.close()
+        if download_uri == referer.encode('utf-8'):
+            with closing(response):
+                response.read()
+            return None, None
 
-        with closing(urlopen( download_uri )) as f:
-            content = StringIO(f.read())
+        if response.getcode() == 206:
+            with closing(response):
+                return download_uri, SCRuRangedFile(self.session, download_uri, response=response)
 
-        #self.logger.debug(u'Got archive: {0}')
+        # no range support, the archive is spooled while it is being listed
+        return download_uri, SpoolFile(response)
+
+    @classmethod
+    def _is_subtitle_file(cls, filename):
+        """Check whether an archive entry is a subtitle file.
+
+        :param filename: Path of the entry within the archive
+        :type filename: unicode
+        :return: True for subtitle files that are not hidden
+        :rtype: bool
+        """
 
-        with RarFile(content) as f:
-            filenames = [
-                filename for filename in f.namelist()
-                if filename.endswith(self._extensions) and not os.path.basename(filename).startswith('.')
-            ]
-
-        for filename in filenames:
-            self.logger.debug(u'Found 1 subtitle at {0}: {1}'.format(archive['referer'], filename))
-            self.listener.on_subtitle_found({
-                'filename': filename,
-                # 'language': archive['language'],
-                # 'rating': archive['rating'],
-                'url': archive['url'],
-                'referer': archive['referer'],
-                'download_uri': download_uri
-            })
+        return filename.endswith(cls._extensions) and not os.path.basename(filename).startswith('.')
 
     @staticmethod
     def _get_subtitle_language(language):
@@ -34,7 +34,10 @@ __temp__ = xbmc.translatePath(os.path.join(__profile__, 'temp')).decode('utf-8')
 sys.path.append(__resource__)
 
 
+import rarfile
 from scruapi import SCRuAPI
+from scrucache import SCRuArchiveStore, SCRuNegativeCache, SCRuSearchCache
+from scruhttp import get_session
 from scrusubtitles import SCRuSubtitles, SCRuSubtitlesListener, SCRuSubtitlesLogger
 
 
@@ -59,13 +62,20 @@ class SCRuSubtitlesService(SCRuSubtitlesListener, SCRuSubtitlesLogger):
 
         # self._omdbapi = OMDbAPI()
         # self._omdbapi.logger = self
+        get_session().load_cookies(os.path.join(__profile__, 'cookies.lwp'))
+        rarfile.TOOL_CACHE_FILE = os.path.join(__profile__, 'unrar.json')
+        rarfile.KEY_CACHE_FILE = os.path.join(__profile__, 'rarkeys.json')
+
         self._scruapi = SCRuAPI()
         self._scruapi.logger = self
+        self._scruapi.cache = SCRuSearchCache(os.path.join(__profile__, 'cache.db'))
+        self._scruapi.negative_cache = SCRuNegativeCache(os.path.join(__profile__, 'cache.db'))
 
         self._provider = SCRuSubtitles()
         self._provider.listener = self
         self._provider.logger = self
         self._provider.workdir = __temp__
+        self._provider.archives = SCRuArchiveStore(os.path.join(__profile__, 'archives'))
 
     def run(self):
         """Run the service, performing the requested action."""
@@ -85,6 +95,14 @@ class SCRuSubtitlesService(SCRuSubtitlesListener, SCRuSubtitlesLogger):
     def _done(self):
         """Tell XBMC that we're done."""
 
+        stats = get_session().pool.stats
+        self.debug(u'HTTP requests: {0}, connections opened: {1}, reused: {2}'.format(
+            stats['requests'], stats['connects'], stats['reuses']))
+        stats = self._scruapi.negative_cache.stats
+        self.debug(u'Negative cache hits: {0}, misses: {1}'.format(stats['hits'], stats['misses']))
+        get_session().save_cookies()
+        get_session().close()
+
         self.debug(u'Done')
         xbmcplugin.endOfDirectory(self._handle)
 
@@ -101,7 +119,7 @@ class SCRuSubtitlesService(SCRuSubtitlesListener, SCRuSubtitlesLogger):
 
         download_page, referer = self._get_scru_sub_download_page()
         if type(download_page) and type(referer) is not unicode:
-                self.inf(u'Search came up empty; no results.\n')
+                self.info(u'Search came up empty; no results.\n')
                 return 0
         #should probably just be "else" here
         if download_page and referer: